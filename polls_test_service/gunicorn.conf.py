@@ -0,0 +1,32 @@
+"""Gunicorn settings, read from the working directory:
+
+	gunicorn polls_test_service.wsgi
+
+Send HUP to the master (GUNICORN_PID file) to restart workers gracefully.
+With preloaded app they keep the old code, for that start a new master with
+USR2, then stop old workers with WINCH and the old master with QUIT.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# More than one thread switches workers to gthread class.
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+# Import Django once in master, workers share its memory copy-on-write.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Restart workers now and then to bound memory growth.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+pidfile = os.environ.get('GUNICORN_PID')
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+
+def pre_fork(server, worker):
+	# Connections opened in master while preloading must not be inherited.
+	from django.db import connections
+	connections.close_all()
@@ -0,0 +1,126 @@
+"""
+ASGI config for polls_test_service project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.2 has no ASGI handler, so the WSGI application runs in a pool of
+ASGI_THREADS threads. asgiref's WsgiToAsgi is not used: it runs every request
+on one shared thread. Reads of polls and user answers are rendered in a
+separate bounded pool and sent from the event loop, so slow clients do not
+hold threads.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgiInstance
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from polls_test_service.wsgi import application as wsgi_application
+
+ASYNC_READS = {'polls-list', 'answers-list'}
+
+
+class Threaded:
+	"""Serves requests with at most `threads` at a time, `ASYNC_READS` GET
+	requests with at most `read_threads` at a time doing database work.
+
+	Streamed responses (`?stream=`) are sent as they are produced, from the
+	request's thread, the rest of `ASYNC_READS` are buffered.
+	"""
+
+	def __init__(self, wsgi_application, threads, read_threads):
+		self.wsgi_application = wsgi_application
+		self.pool = ThreadPoolExecutor(threads, thread_name_prefix='requests')
+		self.reads = (
+			ThreadPoolExecutor(read_threads, thread_name_prefix='reads')
+			if read_threads else None
+		)
+
+	async def __call__(self, scope, receive, send):
+		if scope['type'] != 'http':
+			raise ValueError("Only HTTP is served.")
+		loop = asyncio.get_running_loop()
+		with SpooledTemporaryFile(max_size=65536) as body:
+			while True:
+				message = await receive()
+				body.write(message.get('body', b''))
+				if not message.get('more_body'):
+					break
+			body.seek(0)
+			instance = WsgiToAsgiInstance(self.wsgi_application)
+			instance.scope = scope
+			environ = instance.build_environ(scope, body)
+			if not self.is_async_read(scope):
+				def send_sync(message):
+					asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+				return await loop.run_in_executor(
+					self.pool, self.respond, environ, send_sync
+				)
+		status, headers, chunks = await loop.run_in_executor(
+			self.reads, self.render, environ
+		)
+		await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+		if scope['method'] == 'HEAD':
+			chunks = []
+		for chunk in chunks:
+			await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+		await send({'type': 'http.response.body'})
+
+	def is_async_read(self, scope):
+		if (
+			not self.reads or scope['method'] not in ('GET', 'HEAD')
+			or 'stream' in parse_qs(scope['query_string'].decode('latin1'))
+		):
+			return False
+		try:
+			return resolve(scope['path']).url_name in ASYNC_READS
+		except Resolver404:
+			return False
+
+	def run(self, environ):
+		"""Status, headers and body iterable of WSGI response."""
+		started = []
+
+		def start_response(status, headers, exc_info=None):
+			started[:] = int(status.split(' ', 1)[0]), [
+				(name.lower().encode('latin1'), value.encode('latin1'))
+				for name, value in headers
+			]
+
+		response = self.wsgi_application(environ, start_response)
+		return (*started, response)
+
+	def render(self, environ):
+		"""Status, headers and body chunks of WSGI response."""
+		status, headers, response = self.run(environ)
+		try:
+			chunks = [chunk for chunk in response if chunk]
+		finally:
+			# Sends request_finished, which releases database connection.
+			if hasattr(response, 'close'):
+				response.close()
+		return status, headers, chunks
+
+	def respond(self, environ, send):
+		"""Send WSGI response with `send` as it is produced."""
+		status, headers, response = self.run(environ)
+		try:
+			send({'type': 'http.response.start', 'status': status, 'headers': headers})
+			if environ['REQUEST_METHOD'] != 'HEAD':
+				for chunk in response:
+					if chunk:
+						send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+			send({'type': 'http.response.body'})
+		finally:
+			if hasattr(response, 'close'):
+				response.close()
+
+
+application = Threaded(
+	wsgi_application, settings.ASGI_THREADS, settings.ASGI_READ_THREADS
+)
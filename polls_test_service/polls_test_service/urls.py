@@ -4,7 +4,8 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
 from polls_test_service_app.views import (
-	Answer, Poll, PollsList, Question, QuestionsList, UserAnswers
+	Answer, AnswersBatch, AnswersExport, AnswerStatus, Poll, PollsImport, PollsList,
+	Question, QuestionsList, Results, Stats, UserAnswers
 )
 
 router = DefaultRouter()
@@ -12,15 +13,21 @@ router = DefaultRouter()
 urlpatterns = router.urls + [
 	path('polls/', include([
 		path('', PollsList.as_view(), name='polls-list'),
+		path('import/', PollsImport.as_view(), name='polls-import'),
 		path('<pk>/', Poll.as_view(), name='poll-details'),
 		path('<int:poll_id>/', include([
 			path('answer/', Answer.as_view(), name='answer-create'),
+			path('answer/<str:key>/', AnswerStatus.as_view(), name='answer-status'),
+			path('answers/batch/', AnswersBatch.as_view(), name='answers-batch'),
+			path('answers/export/', AnswersExport.as_view(), name='answers-export'),
 			path('questions/', QuestionsList.as_view(), name='questions-list'),
 			path('questions/<pk>/', Question.as_view(), name='question-details'),
+			path('results/', Results.as_view(), name='poll-results'),
 		]))
 	])),
 	path('users/', include([
 		path('<int:user_id>/answers/', UserAnswers.as_view(), name='answers-list'),
 		path('login/', obtain_auth_token, name='login'),
-	]))
+	])),
+	path('stats/', Stats.as_view(), name='stats'),
 ]
@@ -0,0 +1 @@
+default_app_config = 'polls_test_service_app.apps.PollsTestServiceAppConfig'
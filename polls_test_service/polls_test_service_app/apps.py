@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+
+from polls_test_service_app.db import configure_sqlite
 
 
 class PollsTestServiceAppConfig(AppConfig):
     name = 'polls_test_service_app'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+
+        from polls_test_service_app.authentication import forget_token, forget_user
+
+        connection_created.connect(configure_sqlite)
+        post_delete.connect(forget_token, sender=Token)
+        post_save.connect(forget_user, sender=settings.AUTH_USER_MODEL)
@@ -0,0 +1,96 @@
+"""Authentication."""
+
+from collections import OrderedDict
+from copy import copy
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import authentication
+from rest_framework.authtoken.models import Token
+
+from polls_test_service_app import metrics, stats
+
+counter = stats.register('token_cache', stats.HitCounter())
+
+
+class TokenCache:
+	"""Token key to User map, bounded by `TOKEN_CACHE_SIZE` least recently
+	used entries living `TOKEN_CACHE_TTL` seconds.
+
+	With `TOKEN_CACHE_SHARED` entries are kept only in the shared cache, so
+	invalidations made by signals in one process apply to all of them.
+	"""
+
+	def __init__(self):
+		self._lock = Lock()
+		self._users = OrderedDict()
+
+	@staticmethod
+	def _shared_key(key):
+		return f'token:{key}'
+
+	def get(self, key):
+		if settings.TOKEN_CACHE_SHARED:
+			return cache.get(self._shared_key(key))
+		with self._lock:
+			if (entry := self._users.get(key)) is not None:
+				expires, user = entry
+				if expires > monotonic():
+					self._users.move_to_end(key)
+					return copy(user)
+				del self._users[key]
+		return None
+
+	def set(self, key, user):
+		if settings.TOKEN_CACHE_SHARED:
+			cache.set(self._shared_key(key), user, settings.TOKEN_CACHE_TTL)
+			return
+		with self._lock:
+			self._users[key] = monotonic() + settings.TOKEN_CACHE_TTL, copy(user)
+			self._users.move_to_end(key)
+			while len(self._users) > settings.TOKEN_CACHE_SIZE:
+				self._users.popitem(last=False)
+
+	def discard(self, keys):
+		with self._lock:
+			for key in keys:
+				self._users.pop(key, None)
+		if settings.TOKEN_CACHE_SHARED:
+			cache.delete_many([self._shared_key(key) for key in keys])
+
+	def clear(self):
+		with self._lock:
+			self._users.clear()
+
+
+tokens = TokenCache()
+
+
+def forget_token(sender, instance, **kwargs):
+	"""Drop deleted Token from cache."""
+	tokens.discard([instance.key])
+
+
+def forget_user(sender, instance, **kwargs):
+	"""Drop Tokens of changed or deleted User from cache."""
+	tokens.discard(list(Token.objects.filter(user=instance).values_list('key', flat=True)))
+
+
+class TokenAuthentication(authentication.TokenAuthentication):
+	"""Token authentication with cached users, timed as `auth` phase of
+	request."""
+
+	def authenticate(self, request):
+		with metrics.phase('auth'):
+			return super().authenticate(request)
+
+	def authenticate_credentials(self, key):
+		if (user := tokens.get(key)) is not None:
+			counter.hit()
+			return user, Token(key=key, user=user)
+		counter.miss()
+		user, token = super().authenticate_credentials(key)
+		tokens.set(key, user)
+		return user, token
@@ -0,0 +1,287 @@
+"""Benchmark of API hot paths."""
+
+import json
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import count, islice
+from threading import Lock
+from time import perf_counter
+from types import SimpleNamespace
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from polls_test_service_app import fastpath, models, serializers
+from polls_test_service_app.stats import percentile
+from polls_test_service_app.models import QuestionType as QType
+
+BATCH_SIZE = 10000
+
+
+def _batched(objects, size=BATCH_SIZE):
+	objects = iter(objects)
+	while batch := list(islice(objects, size)):
+		yield batch
+
+
+def _bulk_create(model, objects):
+	for batch in _batched(objects):
+		model.objects.bulk_create(batch)
+
+
+class Dataset:
+	"""Ids of seeded Polls, their structure and respondents."""
+
+	def __init__(self):
+		self.polls = {}
+		self.users = []
+		self._lock = Lock()
+		self._new_users = None
+
+	@classmethod
+	def load(cls):
+		dataset = cls()
+		for poll_id, question_id, q_type, choice_id in (
+			models.Question.objects
+			.order_by('poll_id', 'id', 'choices')
+			.values_list('poll_id', 'id', 'q_type', 'choices')
+		):
+			questions = dataset.polls.setdefault(poll_id, {})
+			choices = questions.setdefault(question_id, (q_type, []))[1]
+			if choice_id is not None:
+				choices.append(choice_id)
+		dataset.users = list(
+			models.Submission.objects.order_by('user_id')
+			.values_list('user_id', flat=True).distinct()
+		)
+		return dataset
+
+	def answers(self, poll_id, rand):
+		"""Valid answers to every question of Poll."""
+		answers = []
+		for question_id, (q_type, choices) in self.polls[poll_id].items():
+			if QType(q_type) is QType.ARBITRARY:
+				answers.append((question_id, None, "Benchmark answer."))
+				continue
+			picked = rand.randint(1, len(choices)) if QType(q_type) is QType.MANY else 1
+			answers.extend((question_id, c, None) for c in rand.sample(choices, picked))
+		return answers
+
+	def new_user(self):
+		"""User id who has not answered any Poll yet."""
+		with self._lock:
+			if self._new_users is None:
+				self._new_users = count(max(self.users, default=0) + 1)
+			return next(self._new_users)
+
+
+def seed(polls, questions, choices, answers, users, rand):
+	"""Fill database with finished Polls and about `answers` Answers to them.
+
+	Every Poll gets the same number of respondents taken from `users` ids.
+	"""
+	now = timezone.now()
+	_bulk_create(models.Poll, (
+		models.Poll(
+			title=f"Poll {i}", description="Benchmark poll.",
+			start_date=now - timedelta(days=2), end_date=now - timedelta(days=1)
+		) for i in range(polls)
+	))
+	poll_ids = list(models.Poll.objects.order_by('id').values_list('id', flat=True))
+	q_types = tuple(QType)
+	_bulk_create(models.Question, (
+		models.Question(
+			poll_id=poll_id, text=f"Question {i}", q_type=q_types[i % len(q_types)].value
+		) for poll_id in poll_ids for i in range(questions)
+	))
+	_bulk_create(models.Choice, (
+		models.Choice(question_id=question_id, text=f"Choice {i}")
+		for question_id, q_type in models.Question.objects
+		.filter(poll_id__in=poll_ids).order_by('id').values_list('id', 'q_type').iterator()
+		if QType(q_type) is not QType.ARBITRARY
+		for i in range(choices)
+	))
+	dataset = Dataset.load()
+
+	respondents = min(users, max(1, answers // max(1, polls * questions)))
+	tallies = Counter()
+
+	def submissions():
+		for poll_id in poll_ids:
+			for user_id in rand.sample(range(1, users + 1), respondents):
+				yield poll_id, user_id
+
+	def answer_rows(batch):
+		for poll_id, user_id in batch:
+			for question_id, choice_id, arbitrary in dataset.answers(poll_id, rand):
+				if choice_id is not None:
+					tallies[question_id, choice_id] += 1
+				yield models.Answer(
+					user_id=user_id, poll_id=poll_id, question_id=question_id,
+					choice_id=choice_id, arbitrary=arbitrary
+				)
+			for question_id in dataset.polls[poll_id]:
+				tallies[question_id, None] += 1
+
+	for batch in _batched(submissions(), max(1, BATCH_SIZE // max(1, questions))):
+		models.Submission.objects.bulk_create(
+			models.Submission(poll_id=poll_id, user_id=user_id) for poll_id, user_id in batch
+		)
+		_bulk_create(models.Answer, answer_rows(batch))
+	_bulk_create(models.Tally, (
+		models.Tally(question_id=question_id, choice_id=choice_id, count=n)
+		for (question_id, choice_id), n in tallies.items() if n
+	))
+	return Dataset.load()
+
+
+class Scenario:
+	"""Request to one endpoint with random arguments."""
+
+	def __init__(self, name, dataset, page_size):
+		self.name = name
+		self.dataset = dataset
+		self.page_size = page_size
+
+	def request(self, client, rand):
+		poll_ids = list(self.dataset.polls)
+		if self.name == 'polls-list':
+			query = f'?page_size={self.page_size}' if self.page_size else ''
+			return client.get(reverse('polls-list') + query)
+		if self.name == 'poll-details':
+			return client.get(reverse('poll-details', args=(rand.choice(poll_ids),)))
+		if self.name == 'answers-list':
+			return client.get(reverse('answers-list', args=(rand.choice(self.dataset.users),)))
+		if self.name == 'answer-create':
+			poll_id = rand.choice(poll_ids)
+			data = {
+				'user_id': self.dataset.new_user(),
+				'answers': [
+					{'question_id': q, 'choice': arbitrary if c is None else c}
+					for q, c, arbitrary in self.dataset.answers(poll_id, rand)
+				]
+			}
+			return client.post(
+				reverse('answer-create', args=(poll_id,)), data, content_type='application/json'
+			)
+		raise ValueError(f"Unknown scenario {self.name}.")
+
+
+SCENARIOS = ('polls-list', 'poll-details', 'answer-create', 'answers-list')
+
+
+class HttpClient:
+	"""Makes requests of test Client to a running server over HTTP."""
+
+	def __init__(self, base_url):
+		self.base_url = base_url.rstrip('/')
+
+	def get(self, path):
+		return self._open(Request(self.base_url + path))
+
+	def post(self, path, data, content_type):
+		return self._open(Request(
+			self.base_url + path, json.dumps(data).encode(), {'Content-Type': content_type}
+		))
+
+	@staticmethod
+	def _open(request):
+		try:
+			with urlopen(request) as response:
+				response.read()
+				return SimpleNamespace(status_code=response.status)
+		except HTTPError as e:
+			return SimpleNamespace(status_code=e.code)
+
+
+def _drive(scenario, requests, seed_value, base_url=None):
+	rand = random.Random(seed_value)
+	client = HttpClient(base_url) if base_url else Client()
+	latencies, queries, errors = [], 0, 0
+	for _ in range(requests):
+		with CaptureQueriesContext(connection) as captured:
+			started = perf_counter()
+			try:
+				failed = scenario.request(client, rand).status_code >= 400
+			except Exception:  # Test client re-raises server errors.
+				failed = True
+			latencies.append(perf_counter() - started)
+		queries += len(captured)
+		errors += failed
+	return latencies, queries, errors
+
+
+def _drive_in_thread(*args):
+	try:
+		return _drive(*args)
+	finally:
+		connection.close()
+
+
+def run(
+	dataset, scenarios=SCENARIOS, requests=100, workers=1, page_size=100,
+	seed_value=0, base_url=None
+):
+	"""Drive each scenario with `requests` spread over `workers` threads.
+
+	With a single worker requests are made from the current thread, so they
+	see uncommitted data of its connection. With `base_url` they are sent to
+	a server using the same database, and its queries are not counted.
+	"""
+	results = {}
+	for name in scenarios:
+		scenario = Scenario(name, dataset, page_size)
+		started = perf_counter()
+		if workers == 1:
+			outcomes = [_drive(scenario, requests, seed_value, base_url)]
+		else:
+			shares = [requests // workers + (i < requests % workers) for i in range(workers)]
+			with ThreadPoolExecutor(max_workers=workers) as pool:
+				outcomes = list(pool.map(
+					_drive_in_thread, [scenario] * workers, shares,
+					range(seed_value, seed_value + workers), [base_url] * workers
+				))
+		elapsed = perf_counter() - started
+		latencies = sorted(latency for outcome in outcomes for latency in outcome[0])
+		results[name] = {
+			'requests': len(latencies),
+			'errors': sum(outcome[2] for outcome in outcomes),
+			'seconds': round(elapsed, 4),
+			'rps': round(len(latencies) / elapsed, 2),
+			'latency_ms': {
+				f'p{p}': round(percentile(latencies, p) * 1000, 3) for p in (50, 95, 99)
+			},
+			'queries_per_request': None if base_url else round(
+				sum(outcome[1] for outcome in outcomes) / len(latencies), 2
+			),
+		}
+	return results
+
+
+def serialization(rounds=3):
+	"""Best of `rounds` microseconds per Poll with its questions and choices
+	serialized by `serializers.Poll` and by `fastpath`, queries included."""
+	polls = models.Poll.objects.all()
+	paths = {
+		'serializer': lambda: serializers.Poll(
+			polls.prefetch_related('questions__choices'), many=True
+		).data,
+		'fastpath': lambda: fastpath.polls(polls.values(*fastpath.POLL_COLUMNS)),
+	}
+	total = polls.count()
+	timings = {}
+	for name, serialize in paths.items():
+		best = float('inf')
+		for _ in range(rounds):
+			started = perf_counter()
+			serialize()
+			best = min(best, perf_counter() - started)
+		timings[name] = round(best / max(1, total) * 1e6, 2)
+	return {'polls': total, 'us_per_poll': timings}
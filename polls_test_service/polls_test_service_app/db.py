@@ -0,0 +1,74 @@
+"""Database connection tuning and backend-specific queries."""
+
+import random
+import sqlite3
+from functools import wraps
+from itertools import count
+from time import sleep
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+
+def configure_sqlite(sender, connection, **kwargs):
+	"""Apply `SQLITE_PRAGMAS` to new SQLite connection."""
+	if connection.vendor != 'sqlite':
+		return
+	with connection.cursor() as cursor:
+		for name, value in settings.SQLITE_PRAGMAS.items():
+			cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked(error):
+	return 'database is locked' in str(error)
+
+
+def retry_on_locked(func):
+	"""Repeat `func` failed with "database is locked" after growing pauses.
+
+	Only outside of transactions, which are rolled back by the error anyway.
+	"""
+	@wraps(func)
+	def wrapper(*args, **kwargs):
+		for attempt in count():
+			try:
+				return func(*args, **kwargs)
+			except OperationalError as e:
+				if (
+					not is_locked(e) or connection.in_atomic_block
+					or attempt >= settings.DATABASE_LOCKED_RETRIES
+				):
+					raise
+			delay = settings.DATABASE_LOCKED_BACKOFF * 2 ** attempt
+			sleep(delay * random.uniform(0.5, 1.5))
+	return wrapper
+
+
+def can_upsert():
+	"""Whether database has `INSERT ... ON CONFLICT ... RETURNING`."""
+	if not settings.DATABASE_UPSERT:
+		return False
+	if connection.vendor == 'sqlite':
+		return sqlite3.sqlite_version_info >= (3, 35)
+	return connection.vendor == 'postgresql'
+
+
+def upsert(model, fields, rows, conflict='', update='', returning=None):
+	"""Insert `rows` of `fields` values, on conflict with existing ones
+	`update` them, or skip if not given.
+
+	`conflict` is a target like `("question_id") WHERE "choice_id" IS NULL`.
+	Returns values of `returning` column of saved rows, or their number.
+	"""
+	qn = connection.ops.quote_name
+	row = f"({', '.join(['%s'] * len(fields))})"
+	sql = (
+		f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(map(qn, fields))}) "
+		f"VALUES {', '.join([row] * len(rows))} ON CONFLICT {conflict} "
+		+ (f"DO UPDATE SET {update}" if update else "DO NOTHING")
+	)
+	if returning:
+		sql += f" RETURNING {qn(returning)}"
+	with connection.cursor() as cursor:
+		cursor.execute(sql, [value for row in rows for value in row])
+		return [row[0] for row in cursor.fetchall()] if returning else cursor.rowcount
@@ -0,0 +1,58 @@
+"""Export of Poll Answers."""
+
+import csv
+import json
+
+from polls_test_service_app import models
+
+FIELDS = (
+	'id', 'user_id', 'question_id', 'question', 'choice_id', 'choice', 'arbitrary'
+)
+
+
+def answer_batches(poll_id, batch_size=1000):
+	"""Answer rows of Poll in batches of short queries paginated by id.
+
+	No read transaction stays open between batches, so writers are only
+	blocked while a single batch is read.
+	"""
+	answers = (
+		models.Answer.objects
+		.filter(poll_id=poll_id).order_by('id')
+		.values_list(
+			'id', 'user_id', 'question_id', 'question__text',
+			'choice_id', 'choice__text', 'arbitrary'
+		)
+	)
+	last_id = 0
+	while rows := list(answers.filter(id__gt=last_id)[:batch_size]):
+		yield rows
+		last_id = rows[-1][0]
+
+
+class _Echo:
+	"""File-like object for `csv.writer` returning what is written."""
+
+	def write(self, value):
+		return value
+
+
+def as_csv(batches):
+	writer = csv.writer(_Echo())
+	yield writer.writerow(FIELDS)
+	for rows in batches:
+		yield ''.join(writer.writerow(row) for row in rows)
+
+
+def as_ndjson(batches):
+	for rows in batches:
+		yield ''.join(
+			json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n'
+			for row in rows
+		)
+
+
+FORMATS = {
+	'csv': (as_csv, 'text/csv'),
+	'ndjson': (as_ndjson, 'application/x-ndjson'),
+}
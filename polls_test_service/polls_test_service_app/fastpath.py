@@ -0,0 +1,78 @@
+"""Read-only Poll and Question serialization from `values()` rows.
+
+Gives the same data as `serializers.Poll` and `serializers.Question` with
+`many=True`, without per-field serializer dispatch.
+"""
+
+from operator import itemgetter
+
+from rest_framework.fields import DateTimeField
+
+from polls_test_service_app import models
+
+POLL_COLUMNS = 'id', 'title', 'description', 'start_date', 'end_date'
+QUESTION_COLUMNS = 'id', 'text', 'q_type'
+
+_datetime = DateTimeField().to_representation
+
+
+def _date_getter(name):
+	get = itemgetter(name)
+	return lambda row: _datetime(get(row))
+
+
+def _build(rows, fields, accessors):
+	getters = [(name, get) for name, get in accessors if fields is None or name in fields]
+	return [{name: get(row) for name, get in getters} for row in rows]
+
+
+def _choices(questions):
+	"""{question id: [choice]} of Questions matching `questions` filter."""
+	choices = {}
+	for question_id, choice_id, text in (
+		models.Choice.objects.filter(**questions).order_by('id')
+		.values_list('question_id', 'id', 'text')
+	):
+		choices.setdefault(question_id, []).append({'id': choice_id, 'text': text})
+	return choices
+
+
+def _questions(rows, fields, choices):
+	return _build(rows, fields, (
+		('id', itemgetter('id')),
+		('text', itemgetter('text')),
+		('q_type', itemgetter('q_type')),
+		('choices', lambda row: choices.get(row['id'], [])),
+	))
+
+
+def polls(rows, fields=None):
+	"""Polls from rows with `POLL_COLUMNS`, limited to `fields` if given."""
+	rows = list(rows)
+	questions = {}
+	if fields is None or 'questions' in fields:
+		poll_ids = [row['id'] for row in rows]
+		choices = _choices({'question__poll_id__in': poll_ids})
+		question_rows = list(
+			models.Question.objects.filter(poll_id__in=poll_ids).order_by('id')
+			.values('poll_id', *QUESTION_COLUMNS)
+		)
+		for question, row in zip(_questions(question_rows, None, choices), question_rows):
+			questions.setdefault(row['poll_id'], []).append(question)
+	return _build(rows, fields, (
+		('id', itemgetter('id')),
+		('questions', lambda row: questions.get(row['id'], [])),
+		('title', itemgetter('title')),
+		('description', itemgetter('description')),
+		('start_date', _date_getter('start_date')),
+		('end_date', _date_getter('end_date')),
+	))
+
+
+def questions(rows, fields=None):
+	"""Questions from rows with `QUESTION_COLUMNS`, limited to `fields` if given."""
+	rows = list(rows)
+	choices = {}
+	if fields is None or 'choices' in fields:
+		choices = _choices({'question_id__in': [row['id'] for row in rows]})
+	return _questions(rows, fields, choices)
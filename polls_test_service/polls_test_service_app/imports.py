@@ -0,0 +1,55 @@
+"""Import of Polls with their Questions and Choices."""
+
+import json
+from collections import namedtuple
+
+from polls_test_service_app import serializers
+from polls_test_service_app.db import retry_on_locked
+
+Unparsable = namedtuple('Unparsable', 'error')
+
+
+def parse(text):
+	"""Items of JSON object or array, or of NDJSON lines.
+
+	Lines which are not JSON become `Unparsable` items.
+	"""
+	try:
+		data = json.loads(text)
+	except ValueError:
+		pass
+	else:
+		return data if isinstance(data, list) else [data]
+	items = []
+	for line in text.splitlines():
+		if not line.strip():
+			continue
+		try:
+			items.append(json.loads(line))
+		except ValueError as e:
+			items.append(Unparsable(f"Invalid JSON: {e}."))
+	return items
+
+
+@retry_on_locked
+def _save(serializer):
+	return serializer.save()
+
+
+def import_polls(items):
+	"""Save each valid item in its own transaction.
+
+	Returns results in order of items: `{'index', 'id'}` of saved Polls and
+	`{'index', 'errors'}` of the rest.
+	"""
+	results = []
+	for index, item in enumerate(items):
+		if isinstance(item, Unparsable):
+			results.append({'index': index, 'errors': {'non_field_errors': [item.error]}})
+			continue
+		serializer = serializers.ImportedPoll(data=item)
+		if serializer.is_valid():
+			results.append({'index': index, 'id': _save(serializer).id})
+		else:
+			results.append({'index': index, 'errors': serializer.errors})
+	return results
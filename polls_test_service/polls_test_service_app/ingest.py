@@ -0,0 +1,128 @@
+"""Durable queue of answer submissions, saved to database in batches.
+
+Submissions are kept in a separate SQLite file, so accepting them does not
+wait for the main database write lock. Run one `drain_answers` worker per
+queue file.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from polls_test_service_app import models, serializers
+from polls_test_service_app.db import retry_on_locked
+
+QUEUED, SAVED, REJECTED = 'queued', 'saved', 'rejected'
+
+Item = namedtuple('Item', 'key poll_id user_id answers status error')
+
+COLUMNS = ', '.join(Item._fields)
+
+SCHEMA = (
+	'CREATE TABLE IF NOT EXISTS submission ('
+	'key TEXT PRIMARY KEY, poll_id INTEGER NOT NULL, user_id INTEGER NOT NULL, '
+	'answers TEXT NOT NULL, status TEXT NOT NULL, error TEXT, created REAL NOT NULL)',
+	'CREATE INDEX IF NOT EXISTS submission_status ON submission (status)',
+)
+
+_local = threading.local()
+
+
+def connect():
+	"""Current thread's connection to `ANSWER_QUEUE_PATH` file."""
+	path = settings.ANSWER_QUEUE_PATH
+	if getattr(_local, 'path', None) != path:
+		if hasattr(_local, 'queue'):
+			_local.queue.close()
+		queue = sqlite3.connect(path, timeout=20, isolation_level=None)
+		queue.execute('PRAGMA journal_mode = wal')
+		for statement in SCHEMA:
+			queue.execute(statement)
+		_local.path, _local.queue = path, queue
+	return _local.queue
+
+
+def _item(row):
+	key, poll_id, user_id, answers, status, error = row
+	return Item(key, poll_id, user_id, json.loads(answers), status, error)
+
+
+def get(key):
+	row = connect().execute(
+		f'SELECT {COLUMNS} FROM submission WHERE key = ?', (key,)
+	).fetchone()
+	return None if row is None else _item(row)
+
+
+def enqueue(key, poll_id, user_id, answers):
+	"""Add validated answers unless `key` is taken, return stored Item."""
+	connect().execute(
+		'INSERT OR IGNORE INTO submission '
+		'(key, poll_id, user_id, answers, status, created) VALUES (?, ?, ?, ?, ?, ?)',
+		(key, poll_id, user_id, json.dumps(answers), QUEUED, time.time())
+	)
+	return get(key)
+
+
+@retry_on_locked
+def save(items):
+	"""Save Items in one transaction, return errors by key."""
+	errors, answers = {}, []
+	with transaction.atomic():
+		for item in items:
+			if not models.Submission.objects.claim(item.user_id, item.poll_id, item.key):
+				# Saved by an earlier drain that was not marked, or answered otherwise.
+				saved = models.Submission.objects.filter(
+					user_id=item.user_id, poll_id=item.poll_id, key=item.key
+				).exists()
+				errors[item.key] = None if saved else serializers.ANSWERED['user_id']
+				continue
+			errors[item.key] = None
+			answers += serializers.answer_rows(item.user_id, item.poll_id, item.answers)
+		if answers:
+			models.Tally.objects.add_answers(answers)
+			models.Answer.objects.bulk_create(answers)
+	return errors
+
+
+def drain(batch_size):
+	"""Save up to `batch_size` oldest queued Items, return their number.
+
+	Items are marked after the database commit, so ones saved right before
+	a crash are drained again and found saved by their Submission key.
+	"""
+	queue = connect()
+	items = [
+		_item(row) for row in queue.execute(
+			f'SELECT {COLUMNS} FROM submission WHERE status = ? ORDER BY rowid LIMIT ?',
+			(QUEUED, batch_size)
+		)
+	]
+	if not items:
+		return 0
+	try:
+		errors = save(items)
+	except IntegrityError:
+		# Poll or its question was deleted after validation, find which Items
+		# are affected by saving them one by one.
+		errors = {}
+		for item in items:
+			try:
+				errors.update(save([item]))
+			except IntegrityError as e:
+				errors[item.key] = str(e)
+	queue.execute('BEGIN IMMEDIATE')
+	queue.executemany(
+		'UPDATE submission SET status = ?, error = ? WHERE key = ?',
+		[
+			(SAVED if error is None else REJECTED, error, key)
+			for key, error in errors.items()
+		]
+	)
+	queue.execute('COMMIT')
+	return len(items)
@@ -0,0 +1,100 @@
+"""Benchmark API hot paths."""
+
+import json
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+
+from polls_test_service_app import benchmark, models
+
+
+class Command(BaseCommand):
+	"""Seed a separate database with synthetic data and measure requests."""
+
+	help = (
+		"Seed the test database with synthetic polls and answers, drive API "
+		"endpoints through the test client and print results as JSON."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument('--polls', type=int, default=100)
+		parser.add_argument('--questions', type=int, default=10, help="Per poll.")
+		parser.add_argument('--choices', type=int, default=4, help="Per question.")
+		parser.add_argument('--answers', type=int, default=100000, help="In total.")
+		parser.add_argument('--users', type=int, default=1000, help="Respondents pool.")
+		parser.add_argument(
+			'--scenario', dest='scenarios', action='append', choices=benchmark.SCENARIOS,
+			help="Endpoint to drive, may be repeated. All of them by default."
+		)
+		parser.add_argument('--requests', type=int, default=200, help="Per endpoint.")
+		parser.add_argument('--workers', type=int, default=1, help="Concurrent threads.")
+		parser.add_argument(
+			'--page-size', type=int, default=100,
+			help="Page size of polls-list, 0 for the whole list."
+		)
+		parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+		parser.add_argument(
+			'--keepdb', action='store_true',
+			help="Keep the seeded database and reuse it next time."
+		)
+		parser.add_argument(
+			'--serialization', action='store_true',
+			help="Also measure serialization of all polls by both read paths."
+		)
+		parser.add_argument(
+			'--url', help=(
+				"Base URL of a running server to drive over HTTP instead of the "
+				"test client. The server must use the seeded database: run "
+				"benchmark with --keepdb first and start the server with "
+				"DATABASE_URL=sqlite:///data/test_db.sqlite3."
+			)
+		)
+		parser.add_argument('--output', '-o', help="File to write results to.")
+
+	def handle(self, *args, **options):
+		databases = setup_databases(
+			verbosity=0, interactive=False, keepdb=options['keepdb']
+		)
+		try:
+			report = self.benchmark(options)
+		finally:
+			teardown_databases(databases, verbosity=0, keepdb=options['keepdb'])
+		result = json.dumps(report, indent=2)
+		if options['output']:
+			with open(options['output'], 'w') as output:
+				output.write(result + '\n')
+		else:
+			self.stdout.write(result)
+
+	def benchmark(self, options):
+		rand = random.Random(options['seed'])
+		started = perf_counter()
+		if models.Poll.objects.exists():
+			dataset = benchmark.Dataset.load()
+		else:
+			dataset = benchmark.seed(
+				options['polls'], options['questions'], options['choices'],
+				options['answers'], options['users'], rand
+			)
+		seconds = perf_counter() - started
+		report = {
+			'dataset': {
+				'polls': len(dataset.polls),
+				'answers': models.Answer.objects.count(),
+				'users': len(dataset.users),
+				'seconds': round(seconds, 2),
+			},
+			'options': {
+				key: options[key]
+				for key in ('requests', 'workers', 'page_size', 'seed', 'url')
+			},
+			'results': benchmark.run(
+				dataset, options['scenarios'] or benchmark.SCENARIOS, options['requests'],
+				options['workers'], options['page_size'], options['seed'], options['url']
+			),
+		}
+		if options['serialization']:
+			report['serialization'] = benchmark.serialization()
+		return report
@@ -15,7 +15,7 @@ class Command(createsuperuser.Command):
 			help=(
 				"Create superuser with password from environment variables "
 				"DJANGO_SUPERUSER_USERNAME and DJANGO_SUPERUSER_PASSWORD "
-				"like in Django 3.0."
+				"like in Django 3.0, unless the user exists."
 			)
 		)
 
@@ -24,9 +24,14 @@ class Command(createsuperuser.Command):
 			super().handle(*args, **options)
 			return
 		username = os.environ['DJANGO_SUPERUSER_USERNAME']
-		password = os.environ['DJANGO_SUPERUSER_PASSWORD']
-		options[self.UserModel.USERNAME_FIELD] = username
-		options['password'] = password
-		options['interactive'] = False
-		super().handle(*args, **options)
-		self.UserModel.objects.get(username=username).set_password(password)
+		users = self.UserModel._default_manager.db_manager(options['database'])
+		if users.filter(**{self.UserModel.USERNAME_FIELD: username}).exists():
+			if options['verbosity'] >= 1:
+				self.stdout.write(f"Superuser {username} already exists.")
+			return
+		users.create_superuser(
+			password=os.environ['DJANGO_SUPERUSER_PASSWORD'],
+			**{self.UserModel.USERNAME_FIELD: username}
+		)
+		if options['verbosity'] >= 1:
+			self.stdout.write("Superuser created successfully.")
@@ -0,0 +1,49 @@
+"""Save queued Answers."""
+
+import logging
+from time import sleep
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from polls_test_service_app import ingest
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+	"""Drain answer queue into database in batched transactions."""
+
+	help = "Save answers accepted with ANSWER_QUEUE=1 to database."
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'--batch-size', type=int, default=500,
+			help="Submissions saved by one transaction."
+		)
+		parser.add_argument(
+			'--interval', type=float, default=1.0,
+			help="Seconds to wait when the queue is empty."
+		)
+		parser.add_argument(
+			'--once', action='store_true', help="Exit when the queue is empty."
+		)
+
+	def handle(self, *args, **options):
+		batch_size, total = options['batch_size'], 0
+		while True:
+			try:
+				drained = ingest.drain(batch_size)
+			except OperationalError:
+				# Left queued, saved by one of the next attempts.
+				logger.exception("Draining answers failed, retrying.")
+				close_old_connections()
+				sleep(options['interval'])
+				continue
+			total += drained
+			if drained == batch_size:
+				continue
+			if options['once']:
+				break
+			sleep(options['interval'])
+		self.stdout.write(f"Submissions drained: {total}.")
@@ -0,0 +1,38 @@
+"""Export Poll Answers."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls_test_service_app import export
+from polls_test_service_app.models import Poll
+
+
+class Command(BaseCommand):
+	"""Write all Answers to a Poll as CSV or NDJSON."""
+
+	help = "Export answers to a poll with question and choice texts."
+
+	def add_arguments(self, parser):
+		parser.add_argument('poll_id', type=int, help="Poll id.")
+		parser.add_argument(
+			'--type', choices=tuple(export.FORMATS), default='csv',
+			help="Output format, csv by default."
+		)
+		parser.add_argument(
+			'--batch-size', type=int, default=1000,
+			help="Answers read from database by one query."
+		)
+		parser.add_argument(
+			'--output', '-o', help="File to write to instead of standard output."
+		)
+
+	def handle(self, *args, **options):
+		if not Poll.objects.filter(id=options['poll_id']).exists():
+			raise CommandError(f"Poll {options['poll_id']} not found.")
+		render, _content_type = export.FORMATS[options['type']]
+		chunks = render(export.answer_batches(options['poll_id'], options['batch_size']))
+		if not options['output']:
+			for chunk in chunks:
+				self.stdout.write(chunk, ending='')
+			return
+		with open(options['output'], 'w', newline='') as output:
+			output.writelines(chunks)
@@ -0,0 +1,40 @@
+"""Import Polls."""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls_test_service_app import imports
+
+
+class Command(BaseCommand):
+	"""Create Polls with Questions and Choices from JSON or NDJSON files."""
+
+	help = (
+		"Import polls with nested questions and choices from a JSON object or "
+		"array, or NDJSON with one poll per line. Each poll is saved in its "
+		"own transaction, invalid ones are reported and skipped."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'files', nargs='+', help="Files to import, - for standard input."
+		)
+
+	def handle(self, *args, **options):
+		imported = failed = 0
+		for name in options['files']:
+			if name == '-':
+				text = sys.stdin.read()
+			else:
+				with open(name, encoding='utf-8') as file:
+					text = file.read()
+			for result in imports.import_polls(imports.parse(text)):
+				if 'id' in result:
+					imported += 1
+				else:
+					failed += 1
+					self.stderr.write(f"{name} item {result['index']}: {result['errors']}")
+		self.stdout.write(f"Polls imported: {imported}.")
+		if failed:
+			raise CommandError(f"Polls failed: {failed}.")
@@ -0,0 +1,22 @@
+"""Recount Poll results."""
+
+from django.core.management.base import BaseCommand
+
+from polls_test_service_app.models import Poll, Tally
+
+
+class Command(BaseCommand):
+	"""Rebuild result tallies from saved Answers."""
+
+	help = "Rebuild result tallies of given polls (all by default) from answers."
+
+	def add_arguments(self, parser):
+		parser.add_argument('poll_ids', nargs='*', type=int, help="Poll ids.")
+
+	def handle(self, *args, **options):
+		poll_ids = options['poll_ids']
+		if not poll_ids:
+			poll_ids = Poll.objects.order_by('id').values_list('id', flat=True)
+		for poll_id in poll_ids:
+			Tally.objects.rebuild(poll_id)
+			self.stdout.write(f"Poll {poll_id} tallies rebuilt.")
@@ -0,0 +1,56 @@
+"""Prepare database and start serving."""
+
+import argparse
+import os
+from time import perf_counter
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+SERVER = ['gunicorn', 'polls_test_service.wsgi']
+
+
+class Command(BaseCommand):
+	"""Container entry point."""
+
+	help = (
+		"Apply pending migrations, create superuser from environment if "
+		"DJANGO_SUPERUSER_USERNAME is set, then replace this process with "
+		f"the server command ({' '.join(SERVER)} by default)."
+	)
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			'server', nargs=argparse.REMAINDER, help="Server command and its arguments."
+		)
+		parser.add_argument(
+			'--no-serve', action='store_true', help="Only prepare the database."
+		)
+		parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+	def handle(self, *args, **options):
+		started = perf_counter()
+		verbosity = options['verbosity']
+		executor = MigrationExecutor(connections[options['database']])
+		if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+			call_command(
+				'migrate', database=options['database'], interactive=False,
+				verbosity=verbosity, stdout=self.stdout
+			)
+		elif verbosity >= 1:
+			self.stdout.write("No migrations to apply.")
+		if 'DJANGO_SUPERUSER_USERNAME' in os.environ:
+			call_command(
+				'createsuperuser', from_env=True, database=options['database'],
+				interactive=False, verbosity=verbosity, stdout=self.stdout
+			)
+		if verbosity >= 1:
+			self.stdout.write(f"Ready in {perf_counter() - started:.2f} s.")
+		if options['no_serve']:
+			return
+		server = options['server'] or SERVER
+		connections.close_all()
+		self.stdout.flush()
+		os.execvp(server[0], server)
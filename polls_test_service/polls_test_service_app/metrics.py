@@ -0,0 +1,86 @@
+"""Per-request timings."""
+
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock, local
+from time import perf_counter
+
+from polls_test_service_app.stats import percentile
+
+_current = local()
+
+
+class Timings:
+	"""SQL queries and durations of phases of a request in seconds."""
+
+	def __init__(self):
+		self.started = perf_counter()
+		self.queries = 0
+		self.phases = {'db': 0.0, 'auth': 0.0, 'serialize': 0.0}
+
+	def execute(self, execute, sql, params, many, context):
+		"""Database execute wrapper counting queries and their time."""
+		started = perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			self.phases['db'] += perf_counter() - started
+			self.queries += 1
+
+
+def start():
+	"""Start timings of request handled by current thread."""
+	_current.timings = Timings()
+	return _current.timings
+
+
+def stop():
+	_current.timings = None
+
+
+@contextmanager
+def phase(name):
+	"""Add time spent in block to phase `name` of current request, if timed."""
+	if (timings := getattr(_current, 'timings', None)) is None:
+		yield
+		return
+	started = perf_counter()
+	try:
+		yield
+	finally:
+		timings.phases[name] += perf_counter() - started
+
+
+class LatencyWindows:
+	"""Latencies of last requests by URL name."""
+
+	def __init__(self, size):
+		self.size = size
+		self._lock = Lock()
+		self._windows = {}
+		self._counts = {}
+
+	def add(self, name, seconds, queries):
+		with self._lock:
+			if (window := self._windows.get(name)) is None:
+				window = self._windows[name] = deque(maxlen=self.size)
+			window.append((seconds, queries))
+			self._counts[name] = self._counts.get(name, 0) + 1
+
+	def snapshot(self):
+		with self._lock:
+			windows = {name: list(window) for name, window in self._windows.items()}
+			counts = dict(self._counts)
+		result = {}
+		for name, window in windows.items():
+			latencies = sorted(seconds for seconds, _ in window)
+			result[name] = {
+				'count': counts[name],
+				'window': len(window),
+				**{
+					f'p{p}_ms': round(percentile(latencies, p) * 1000, 3)
+					for p in (50, 95, 99)
+				},
+				'queries_mean': round(sum(q for _, q in window) / len(window), 2),
+			}
+		return result
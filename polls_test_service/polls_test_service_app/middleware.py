@@ -0,0 +1,58 @@
+"""Middleware."""
+
+import json
+import logging
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from polls_test_service_app import metrics, stats
+
+logger = logging.getLogger(__name__)
+
+latencies = stats.register(
+	'requests', metrics.LatencyWindows(settings.REQUEST_TIMING_WINDOW)
+)
+
+
+class TimingMiddleware:
+	"""Report SQL, auth, serialization and total time of requests.
+
+	Enabled by `REQUEST_TIMING` setting. Timings are sent in `Server-Timing`
+	header, logged as JSON and kept for `/stats/` by URL name.
+	"""
+
+	def __init__(self, get_response):
+		if not settings.REQUEST_TIMING:
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+
+	def __call__(self, request):
+		timings = metrics.start()
+		try:
+			with connection.execute_wrapper(timings.execute):
+				response = self.get_response(request)
+		finally:
+			metrics.stop()
+		total = perf_counter() - timings.started
+		phases = {**timings.phases, 'total': total}
+
+		response['Server-Timing'] = ', '.join(
+			f'{phase};dur={seconds * 1000:.3f}'
+			+ (f';desc="{timings.queries} queries"' if phase == 'db' else '')
+			for phase, seconds in phases.items()
+		)
+		match = request.resolver_match
+		name = match.url_name if match and match.url_name else 'unresolved'
+		latencies.add(name, total, timings.queries)
+		logger.info(json.dumps({
+			'view': name,
+			'method': request.method,
+			'path': request.path,
+			'status': response.status_code,
+			'queries': timings.queries,
+			**{f'{phase}_ms': round(seconds * 1000, 3) for phase, seconds in phases.items()},
+		}))
+		return response
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.13 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+
+def delete_duplicates(apps, schema_editor):
+    Answer = apps.get_model('polls_test_service_app', 'Answer')
+    for answers, fields in (
+        (Answer.objects.exclude(choice=None), ('user_id', 'poll', 'question', 'choice')),
+        (Answer.objects.filter(choice=None), ('user_id', 'poll', 'question')),
+    ):
+        first = answers.order_by().values(*fields).annotate(first=models.Min('id'))
+        answers.exclude(id__in=first.values('first')).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_test_service_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='answer',
+            constraint=models.UniqueConstraint(fields=('user_id', 'poll', 'question', 'choice'), name='unique_choice_answer'),
+        ),
+        migrations.AddConstraint(
+            model_name='answer',
+            constraint=models.UniqueConstraint(condition=models.Q(choice=None), fields=('user_id', 'poll', 'question'), name='unique_arbitrary_answer'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.13 on 2026-10-18 10:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_submissions(apps, schema_editor):
+    Answer = apps.get_model('polls_test_service_app', 'Answer')
+    Submission = apps.get_model('polls_test_service_app', 'Submission')
+    passed = Answer.objects.values_list('user_id', 'poll_id').distinct()
+    Submission.objects.bulk_create(
+        (Submission(user_id=user_id, poll_id=poll_id) for user_id, poll_id in passed.iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_test_service_app', '0002_answer_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField()),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='polls_test_service_app.Poll')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='submission',
+            constraint=models.UniqueConstraint(fields=('user_id', 'poll'), name='unique_submission'),
+        ),
+        migrations.RunPython(create_submissions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.13 on 2026-10-18 10:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_answers(apps, schema_editor):
+    Answer = apps.get_model('polls_test_service_app', 'Answer')
+    Tally = apps.get_model('polls_test_service_app', 'Tally')
+    answers = Answer.objects.order_by()
+    responses = answers.values_list('question_id').annotate(models.Count('user_id', distinct=True))
+    picks = answers.exclude(choice=None).values_list('question_id', 'choice_id').annotate(models.Count('id'))
+    Tally.objects.bulk_create(
+        [Tally(question_id=q, count=n) for q, n in responses] +
+        [Tally(question_id=q, choice_id=c, count=n) for q, c, n in picks],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_test_service_app', '0003_submission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tally',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('choice', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='polls_test_service_app.Choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='polls_test_service_app.Question')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tally',
+            constraint=models.UniqueConstraint(fields=('question', 'choice'), name='unique_choice_tally'),
+        ),
+        migrations.AddConstraint(
+            model_name='tally',
+            constraint=models.UniqueConstraint(condition=models.Q(choice=None), fields=('question',), name='unique_question_tally'),
+        ),
+        migrations.RunPython(count_answers, migrations.RunPython.noop),
+    ]
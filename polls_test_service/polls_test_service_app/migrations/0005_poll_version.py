@@ -0,0 +1,24 @@
+# Generated by Django 2.2.13 on 2026-10-18 11:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_test_service_app', '0004_tally'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='modified',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='poll',
+            name='version',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.13 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls_test_service_app', '0005_poll_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='key',
+            field=models.TextField(default=None, editable=False, null=True),
+        ),
+    ]
@@ -1,14 +1,29 @@
 """Models."""
 
+from collections import Counter
 from enum import Enum
 from functools import partial
 
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db.models import ForeignKey, Manager, Model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import (
+	Count, F, ForeignKey, Manager, Model, Q, UniqueConstraint
+)
 from django.db.models.deletion import CASCADE
 from django.db.models.fields import (
 	CharField, DateTimeField, IntegerField, SmallIntegerField, TextField
 )
+from django.utils import timezone
+
+from polls_test_service_app import db
+
+
+class PollManager(Manager):
+	"""For tracking Poll changes."""
+
+	def touch(self, poll_id):
+		"""Mark Poll as changed along with its Questions or Choices."""
+		self.filter(id=poll_id).update(version=F('version') + 1, modified=timezone.now())
 
 
 class Poll(Model):
@@ -18,6 +33,10 @@ class Poll(Model):
 	description = TextField(max_length=4098)
 	start_date = DateTimeField()
 	end_date = DateTimeField()
+	version = IntegerField(default=0, editable=False)
+	modified = DateTimeField(default=timezone.now, editable=False)
+
+	objects = PollManager()
 
 
 class QuestionType(Enum):
@@ -59,6 +78,164 @@ class Answer(Model):
 	question = answer_foreign_key(Question)
 	poll = answer_foreign_key(Poll)
 
+	class Meta:
+		# Both indexes start with (user_id, poll), so they also serve lookups
+		# of user's answers and of user's answers to a poll.
+		constraints = (
+			UniqueConstraint(
+				fields=('user_id', 'poll', 'question', 'choice'),
+				name='unique_choice_answer'
+			),
+			UniqueConstraint(
+				fields=('user_id', 'poll', 'question'), condition=Q(choice=None),
+				name='unique_arbitrary_answer'
+			),
+		)
+
+
+class SubmissionManager(Manager):
+	"""For claiming Poll passes."""
+
+	def claim(self, user_id, poll_id, key=None):
+		"""Save Submission unless User already has one, return if saved."""
+		if db.can_upsert():
+			return bool(db.upsert(
+				self.model, ('user_id', 'poll_id', 'key'), [(user_id, poll_id, key)],
+				returning='id'
+			))
+		try:
+			with transaction.atomic():
+				self.create(user_id=user_id, poll_id=poll_id, key=key)
+		except IntegrityError:
+			return False
+		return True
+
+	def claim_many(self, user_ids, poll_id):
+		"""Save Submissions of Users who have none, return their ids."""
+		if db.can_upsert():
+			return set(db.upsert(
+				self.model, ('user_id', 'poll_id'),
+				[(user_id, poll_id) for user_id in user_ids], returning='user_id'
+			))
+		taken = set(
+			self.filter(poll_id=poll_id, user_id__in=user_ids)
+			.values_list('user_id', flat=True)
+		)
+		new = [user_id for user_id in user_ids if user_id not in taken]
+		try:
+			with transaction.atomic():
+				self.bulk_create(
+					[self.model(user_id=user_id, poll_id=poll_id) for user_id in new]
+				)
+		except IntegrityError:
+			# Some were claimed concurrently since checking.
+			return {user_id for user_id in new if self.claim(user_id, poll_id)}
+		return set(new)
+
+
+class Submission(Model):
+	"""User's pass of a Poll, claimed once before saving the Answers.
+
+	`key` is of the queued submission it was saved from.
+	"""
+
+	user_id = IntegerField()
+	poll = answer_foreign_key(Poll)
+	key = TextField(default=None, null=True, editable=False)
+
+	objects = SubmissionManager()
+
+	class Meta:
+		constraints = (
+			UniqueConstraint(fields=('user_id', 'poll'), name='unique_submission'),
+		)
+
+
+class TallyManager(Manager):
+	"""For counting Answers as they are saved."""
+
+	def add_answers(self, answers):
+		"""Count Answers of one or many users.
+
+		Rows are written sorted by Question and Choice, so concurrent
+		submissions lock the same tallies in the same order and don't deadlock.
+		"""
+		questions = sorted(Counter(
+			question for _user, question in
+			{(answer.user_id, answer.question_id) for answer in answers}
+		).items())
+		choices = sorted(Counter(
+			(answer.question_id, answer.choice_id)
+			for answer in answers if answer.choice_id is not None
+		).items())
+		if db.can_upsert():
+			return self._upsert(questions, choices)
+		self.bulk_create(
+			[self.model(question_id=question) for question, _n in questions] + [
+				self.model(question_id=question, choice_id=choice)
+				for (question, choice), _n in choices
+			],
+			ignore_conflicts=True
+		)
+		for n in sorted({n for _q, n in questions} | {n for _c, n in choices}):
+			self.filter(
+				Q(question_id__in=[q for q, k in questions if k == n], choice=None)
+				| Q(choice_id__in=[c for (_q, c), k in choices if k == n])
+			).update(count=F('count') + n)
+
+	def _upsert(self, questions, choices):
+		qn = connection.ops.quote_name
+		fields = 'question_id', 'choice_id', 'count'
+		increment = (
+			f"{qn('count')} = {qn(self.model._meta.db_table)}.{qn('count')}"
+			f" + EXCLUDED.{qn('count')}"
+		)
+		if questions:
+			db.upsert(
+				self.model, fields,
+				[(question, None, n) for question, n in questions],
+				f"({qn('question_id')}) WHERE {qn('choice_id')} IS NULL", increment
+			)
+		if choices:
+			db.upsert(
+				self.model, fields,
+				[(question, choice, n) for (question, choice), n in choices],
+				f"({qn('question_id')}, {qn('choice_id')})", increment
+			)
+
+	def rebuild(self, poll_id):
+		answers = Answer.objects.filter(poll_id=poll_id).order_by()
+		responses = answers.values_list('question_id')\
+			.annotate(Count('user_id', distinct=True))
+		picks = answers.exclude(choice=None).values_list('question_id', 'choice_id')\
+			.annotate(Count('id'))
+		with transaction.atomic():
+			self.filter(question__poll_id=poll_id).delete()
+			self.bulk_create(
+				[self.model(question_id=q, count=n) for q, n in responses] + [
+					self.model(question_id=q, choice_id=c, count=n) for q, c, n in picks
+				]
+			)
+
+
+class Tally(Model):
+	"""Number of users who answered a Question or picked its Choice."""
+
+	question = answer_foreign_key(Question)
+	choice = answer_foreign_key(Choice, default=None, null=True)
+	count = IntegerField(default=0)
+
+	objects = TallyManager()
+
+	class Meta:
+		constraints = (
+			UniqueConstraint(fields=('question', 'choice'), name='unique_choice_tally'),
+			UniqueConstraint(
+				fields=('question',), condition=Q(choice=None),
+				name='unique_question_tally'
+			),
+		)
+
 
 class UserManager(BaseUserManager):
 	"""For creating users with hashed password."""
@@ -72,11 +249,7 @@ class UserManager(BaseUserManager):
 		return user
 
 	def create_superuser(self, password, **fields):
-		user = self.create_user(password, **fields)
-		user.is_staff = True
-		user.is_superuser = True
-		user.save()
-		return user
+		return self.create_user(password, is_staff=True, is_superuser=True, **fields)
 
 
 class User(AbstractUser):
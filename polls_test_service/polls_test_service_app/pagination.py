@@ -0,0 +1,15 @@
+"""Pagination."""
+
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+	"""Keyset pagination over ids, enabled by `?page_size=`.
+
+	Without `page_size` all rows are returned as a plain list, like before.
+	"""
+
+	ordering = 'id'
+	page_size = None
+	page_size_query_param = 'page_size'
+	max_page_size = 1000
@@ -0,0 +1,50 @@
+"""Cached Poll structures for validating Answers.
+
+Structures are kept under Poll's version and modification time, which
+change with its Questions and Choices, so a change made by one process is
+seen by the others without a shared cache.
+"""
+
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from polls_test_service_app import models, stats
+
+PollStructure = namedtuple('PollStructure', ('id', 'questions', 'choices'))
+PollStructure.__doc__ = """Poll id, {question id: type}, {choice id: question id}."""
+
+counter = stats.register('poll_cache', stats.HitCounter())
+
+
+def load(poll_id):
+	"""Poll structure from database."""
+	return PollStructure(
+		id=poll_id,
+		questions=dict(
+			models.Question.objects.filter(poll_id=poll_id).values_list('id', 'q_type')
+		),
+		choices=dict(
+			models.Choice.objects
+			.filter(question__poll_id=poll_id).values_list('id', 'question_id')
+		)
+	)
+
+
+def get(poll_id):
+	"""Poll structure from cache, loaded on miss, or None if there is no Poll."""
+	state = (
+		models.Poll.objects.filter(id=poll_id).values_list('version', 'modified').first()
+	)
+	if state is None:
+		return None
+	version, modified = state
+	key = f'poll:{poll_id}:{version}:{modified.timestamp()}'
+	if (structure := cache.get(key)) is not None:
+		counter.hit()
+		return structure
+	counter.miss()
+	structure = load(poll_id)
+	cache.set(key, structure, settings.POLL_CACHE_TIMEOUT)
+	return structure
@@ -2,28 +2,82 @@
 
 from functools import partial
 
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from rest_framework.fields import IntegerField, JSONField
 from rest_framework.serializers import (
 	ListSerializer, ModelSerializer, Serializer, ValidationError
 )
 
-from polls_test_service_app import models
+from polls_test_service_app import metrics, models
+from polls_test_service_app.db import retry_on_locked
 from polls_test_service_app.models import QuestionType as QType
 
 
+def _names(request, param):
+	return {name for name in request.query_params.get(param, '').split(',') if name}
+
+
+def requested_fields(request, expandable):
+	"""Names from `?fields=` and `?expand=` of GET request or None for all.
+
+	Nested fields are not projected, so `?expand=` takes only `expandable`
+	names of the top level.
+	"""
+	if request is None or request.method != 'GET':
+		return None
+	if unknown := sorted(_names(request, 'expand') - set(expandable)):
+		raise ValidationError({
+			'expand': f"Unknown fields {unknown}, can be {sorted(expandable)}."
+		})
+	if 'fields' not in request.query_params:
+		return None
+	return _names(request, 'fields') | _names(request, 'expand')
+
+
+def includes_field(request, name):
+	"""Whether nested field `name`, the only expandable one, is in response
+	to `request`."""
+	return (fields := requested_fields(request, (name,))) is None or name in fields
+
+
+class Timed:
+	"""Serializer timed as `serialize` phase of request when outermost."""
+
+	def to_representation(self, instance):
+		if self.parent is not None and self.parent.parent is not None:
+			return super().to_representation(instance)
+		with metrics.phase('serialize'):
+			return super().to_representation(instance)
+
+
+class Projected(ModelSerializer):
+	"""Serializer with fields limited by `requested_fields`."""
+
+	expandable = ()
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		request = self.context.get('request')
+		if (fields := requested_fields(request, self.expandable)) is not None:
+			for name in set(self.fields) - fields:
+				self.fields.pop(name)
+
+
 class Choice(ModelSerializer):
-	"""Question Choice serializer."""
+	"""Question Choice serializer, `id` is given to keep existing Choice."""
+
+	id = IntegerField(required=False)
 
 	class Meta:
 		model = models.Choice
 		fields = 'id', 'text'
 
 
-class Question(ModelSerializer):
+class Question(Timed, Projected):
 	"""Poll Question serializer."""
 
 	choices = Choice(many=True, required=False)
+	expandable = ('choices',)
 
 	class Meta:
 		model = models.Question
@@ -39,37 +93,78 @@ class Question(ModelSerializer):
 				raise ValidationError("Choices are required for this question type.")
 		return value
 
+	def validate_choices(self, value):
+		ids = [choice['id'] for choice in value if 'id' in choice]
+		if len(ids) != len(set(ids)):
+			raise ValidationError("Choice ids must be unique.")
+		known = set()
+		if ids and self.instance is not None:
+			known = set(
+				self.instance.choices.filter(id__in=ids).values_list('id', flat=True)
+			)
+		if unknown := [id_ for id_ in ids if id_ not in known]:
+			raise ValidationError(f"Choices {unknown} not found in this question.")
+		return value
+
 	def create(self, validated_data):
 		choices = validated_data.pop('choices', ())
 		validated_data['poll'] = self.context['poll']
 		with transaction.atomic():
 			question = super().create(validated_data)
-			self._update_choices(question, choices)
+			if QType(question.q_type) is not QType.ARBITRARY:
+				models.Choice.objects.bulk_create(
+					[models.Choice(question=question, **choice) for choice in choices]
+				)
+			models.Poll.objects.touch(question.poll_id)
 		return question
 
 	def update(self, instance, validated_data):
 		choices = validated_data.pop('choices', ())
 		with transaction.atomic():
 			question = super().update(instance, validated_data)
-			if choices or QType(question.q_type) is QType.ARBITRARY:
+			if QType(question.q_type) is QType.ARBITRARY:
 				models.Choice.objects.filter(question=question).delete()
-			self._update_choices(question, choices)
+			elif choices:
+				self._sync_choices(question, choices)
+			models.Poll.objects.touch(question.poll_id)
 		return question
 
-	def _update_choices(self, question, choices):
-		if QType(question.q_type) is not QType.ARBITRARY:
-			for choice in choices:
-				models.Choice.objects.create(question=question, **choice)
+	@staticmethod
+	def _sync_choices(question, choices):
+		"""Make `choices` the only Choices of `question`.
+
+		Ones with `id` are kept with their Answers, changed texts are saved,
+		the rest are created or deleted.
+		"""
+		existing = {
+			choice.id: choice for choice in models.Choice.objects.filter(question=question)
+		}
+		kept = {choice['id']: choice['text'] for choice in choices if 'id' in choice}
+		changed = []
+		for id_, text in kept.items():
+			if existing[id_].text != text:
+				existing[id_].text = text
+				changed.append(existing[id_])
+		models.Choice.objects.bulk_update(changed, ('text',))
+		models.Choice.objects.bulk_create(
+			[
+				models.Choice(question=question, **choice)
+				for choice in choices if 'id' not in choice
+			]
+		)
+		if removed := existing.keys() - kept.keys():
+			models.Choice.objects.filter(id__in=removed).delete()
 
 
-class Poll(ModelSerializer):
+class Poll(Timed, Projected):
 	"""Poll serializer."""
 
 	questions = Question(many=True, read_only=True)
+	expandable = ('questions',)
 
 	class Meta:
 		model = models.Poll
-		fields = '__all__'
+		fields = 'id', 'questions', 'title', 'description', 'start_date', 'end_date'
 
 	def validate(self, attrs):
 		if end_date := attrs.get('end_date'):
@@ -79,7 +174,72 @@ class Poll(ModelSerializer):
 
 	def update(self, instance, validated_data):
 		validated_data.pop('start_date', None)
-		return super().update(instance, validated_data)
+		with transaction.atomic():
+			poll = super().update(instance, validated_data)
+			models.Poll.objects.touch(poll.id)
+		return poll
+
+
+class ImportedQuestion(Question):
+	"""Question of imported Poll."""
+
+	class Meta(Question.Meta):
+		extra_kwargs = {'q_type': {'required': True}}
+
+	def validate_q_type(self, value):
+		try:
+			QType(value)
+		except ValueError as e:
+			raise ValidationError(f"Value must be in {QType.choices()}.") from e
+		return value
+
+	def validate(self, attrs):
+		if QType(attrs['q_type']) is not QType.ARBITRARY and not attrs.get('choices'):
+			raise ValidationError(
+				{'choices': "Choices are required for this question type."}
+			)
+		return attrs
+
+
+class ImportedPoll(Poll):
+	"""Poll with its Questions and Choices, saved by bulk inserts."""
+
+	questions = ImportedQuestion(many=True, required=False)
+
+	def create(self, validated_data):
+		questions = validated_data.pop('questions', ())
+		with transaction.atomic():
+			poll = models.Poll.objects.create(**validated_data)
+			models.Question.objects.bulk_create([
+				models.Question(poll=poll, text=question['text'], q_type=question['q_type'])
+				for question in questions
+			])
+			# Not every backend sets ids of bulk inserted rows, new Poll has
+			# only these Questions in insertion order.
+			question_ids = poll.questions.order_by('id').values_list('id', flat=True)
+			models.Choice.objects.bulk_create([
+				models.Choice(question_id=question_id, text=choice['text'])
+				for question_id, question in zip(question_ids, questions)
+				if QType(question['q_type']) is not QType.ARBITRARY
+				for choice in question.get('choices', ())
+			])
+		return poll
+
+
+ANSWERED = {'user_id': "You've already answered this poll."}
+
+
+def answer_rows(user_id, poll_id, answers):
+	"""Unsaved Answer models from validated answers."""
+	new_answer = partial(models.Answer, user_id=user_id, poll_id=poll_id)
+	rows = []
+	for answer in answers:
+		choice, question_id = answer['choice'], answer['question_id']
+		if isinstance(choice, str):
+			rows.append(new_answer(question_id=question_id, arbitrary=choice))
+		elif isinstance(choice, int):
+			rows.append(new_answer(question_id=question_id, choice_id=choice))
+	return rows
 
 
 class Answer(Serializer):
@@ -91,31 +251,26 @@ class Answer(Serializer):
 	class Meta:
 		fields = 'user_id', 'answers'
 
-	def validate_user_id(self, value):
-		poll = self.context['poll']
-		if models.Answer.objects.filter(user_id=value, poll=poll).exists():
-			raise ValidationError("You've already answered this poll.")
-		return value
-
 	def validate_answers(self, value):
 		if not value:
 			raise ValidationError("Please, provide some answers.")
 		poll = self.context['poll']
-		questions = {q.id: q for q in poll.questions.all()}
 		valid_answers = []
 		found_answers = set()
+		chosen = set()
 		for raw_answer in value:
-			if not (question := questions.get(raw_answer.get('question_id'), None)):
+			question_id = raw_answer.get('question_id')
+			if (q_type := poll.questions.get(question_id, None)) is None:
 				continue
 
 			choice = raw_answer.get('choice')
-			question_type = QType(question.q_type)
+			question_type = QType(q_type)
 
-			if question_type != QType.MANY and question.id in found_answers:
+			if question_type != QType.MANY and question_id in found_answers:
 				raise ValidationError(
-					f"Only single choice allowed for question id {question.id}"
+					f"Only single choice allowed for question id {question_id}"
 				)
-			found_answers.add(question.id)
+			found_answers.add(question_id)
 
 			if question_type == QType.ARBITRARY:
 				if not isinstance(choice, str):
@@ -127,38 +282,88 @@ class Answer(Serializer):
 
 			if not isinstance(choice, int):
 				raise ValidationError(
-					f"Answer to question id {question.id} must be an integer id of a choice."
+					f"Answer to question id {question_id} must be an integer id of a choice."
 				)
-
-			try:
-				existing_choice = models.Choice.objects.get(id=choice)
-			except models.Choice.DoesNotExist as e:
-				raise ValidationError(f"Choice id {choice} not found.") from e
-			if existing_choice.question != question:
+			if choice not in poll.choices:
+				raise ValidationError(f"Choice id {choice} not found.")
+			if poll.choices[choice] != question_id:
 				raise ValidationError(f"Choice id {choice} is for anoher question.")
+			if choice in chosen:
+				raise ValidationError(f"Choice id {choice} is given more than once.")
+			chosen.add(choice)
 			valid_answers.append(raw_answer)
 
-		if len(found_answers) != len(questions):
+		if len(found_answers) != len(poll.questions):
 			raise ValidationError(
-				f"Please, provide answers to questions: {list(questions)}."
+				f"Please, provide answers to questions: {list(poll.questions)}."
 			)
 		return valid_answers
 
 	def create(self, validated_data):
-		create_object = partial(
-			models.Answer.objects.create,
-			user_id=validated_data['user_id'], poll=self.context['poll']
-		)
-		created = []
+		user_id, poll_id = validated_data['user_id'], self.context['poll'].id
+		answers = answer_rows(user_id, poll_id, validated_data['answers'])
+		try:
+			return self._save(user_id, poll_id, answers)
+		except IntegrityError as e:
+			# Answers saved before Submissions existed violate the unique
+			# constraints of Answer, other errors are not about the user.
+			if models.Answer.objects.filter(user_id=user_id, poll_id=poll_id).exists():
+				raise ValidationError(ANSWERED) from e
+			raise
+
+	@staticmethod
+	@retry_on_locked
+	def _save(user_id, poll_id, answers):
 		with transaction.atomic():
-			for answer in validated_data['answers']:
-				choice = answer['choice']
-				if isinstance(choice, str):
-					o = create_object(question_id=answer['question_id'], arbitrary=choice)
-				elif isinstance(choice, int):
-					o = create_object(question_id=answer['question_id'], choice_id=choice)
-				created.append(o)
-		return created
+			if not models.Submission.objects.claim(user_id, poll_id):
+				raise ValidationError(ANSWERED)
+			models.Tally.objects.add_answers(answers)
+			return models.Answer.objects.bulk_create(answers)
 
 	def to_representation(self, instance):
 		return {'result': f"Answers saved: {len(instance)}."}
+
+
+REPEATED = {'user_id': "Given more than once in this batch."}
+
+
+def save_answer_batch(poll, submissions):
+	"""Validate `submissions` of `Answer` data against one Poll structure and
+	save the valid ones together.
+
+	Returns `{'index', 'status'}` of each submission in order, status is
+	`saved` or `rejected` with `errors`.
+	"""
+	checked, answers = [], {}
+	for index, data in enumerate(submissions):
+		serializer = Answer(data=data, context={'poll': poll})
+		user_id = None
+		if not serializer.is_valid():
+			errors = serializer.errors
+		elif serializer.validated_data['user_id'] in answers:
+			errors = REPEATED
+		else:
+			user_id, errors = serializer.validated_data['user_id'], None
+			answers[user_id] = answer_rows(
+				user_id, poll.id, serializer.validated_data['answers']
+			)
+		checked.append((index, user_id, errors))
+	claimed = _save_batch(poll.id, answers) if answers else set()
+	return [
+		{'index': index, 'status': 'saved'} if user_id in claimed else
+		{'index': index, 'status': 'rejected', 'errors': errors or ANSWERED}
+		for index, user_id, errors in checked
+	]
+
+
+@retry_on_locked
+def _save_batch(poll_id, answers):
+	"""Save `{user id: Answers}` of Users who have not answered yet, return
+	their ids."""
+	with transaction.atomic():
+		claimed = models.Submission.objects.claim_many(list(answers), poll_id)
+		rows = [answer for user_id in claimed for answer in answers[user_id]]
+		if rows:
+			models.Tally.objects.add_answers(rows)
+			models.Answer.objects.bulk_create(rows)
+	return claimed
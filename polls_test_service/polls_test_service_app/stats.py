@@ -0,0 +1,49 @@
+"""In-process counters."""
+
+from math import ceil
+from threading import Lock
+
+sources = {}
+
+
+def register(name, source):
+	"""Add `source` with `snapshot()` method to `snapshot`."""
+	sources[name] = source
+	return source
+
+
+def snapshot():
+	"""Current values of all registered counters."""
+	return {name: source.snapshot() for name, source in sources.items()}
+
+
+def percentile(values, p):
+	"""Nearest-rank percentile of sorted `values`."""
+	return values[max(0, ceil(p / 100 * len(values)) - 1)]
+
+
+class HitCounter:
+	"""Cache hits and misses."""
+
+	def __init__(self):
+		self._lock = Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def hit(self):
+		with self._lock:
+			self.hits += 1
+
+	def miss(self):
+		with self._lock:
+			self.misses += 1
+
+	def snapshot(self):
+		with self._lock:
+			hits, misses = self.hits, self.misses
+		total = hits + misses
+		return {
+			'hits': hits,
+			'misses': misses,
+			'hit_rate': round(hits / total, 4) if total else None,
+		}
@@ -1,15 +1,42 @@
 """Tests."""
 
+import asyncio
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
+from io import StringIO
+from random import Random
+from tempfile import TemporaryDirectory
+from threading import Barrier, get_ident
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
+from rest_framework.serializers import ValidationError
 from rest_framework.status import (
-	HTTP_200_OK, HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST,
-	HTTP_401_UNAUTHORIZED, HTTP_404_NOT_FOUND
+	HTTP_200_OK, HTTP_201_CREATED, HTTP_202_ACCEPTED, HTTP_204_NO_CONTENT,
+	HTTP_304_NOT_MODIFIED, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED,
+	HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND, HTTP_429_TOO_MANY_REQUESTS,
+	HTTP_503_SERVICE_UNAVAILABLE
+)
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from polls_test_service import asgi, database_url
+from polls_test_service_app import (
+	authentication, benchmark, db, ingest, models, poll_cache, serializers, throttling,
+	views
 )
-from rest_framework.test import APITestCase
 
 
 class BaseTest(APITestCase):
@@ -45,6 +72,16 @@ class BaseTest(APITestCase):
 		self.assertEqual(response.status_code, expected_status_code, response.data)
 		return response.data
 
+	def count_queries(self, method, url, expected_status_code, data=None):
+		with CaptureQueriesContext(connection) as queries:
+			self.request(method, url, expected_status_code, data)
+		return len(queries)
+
+	def tearDown(self):
+		cache.clear()
+		authentication.tokens.clear()
+		throttling.buckets.clear()
+
 	def authorize(self):
 		get_user_model().objects.create_superuser(**self.cred)
 		data = self.request('post', self.auth_url, HTTP_200_OK, self.cred)
@@ -76,6 +113,36 @@ class AuthTest(BaseTest):
 		self.request('delete', self.q_url, HTTP_204_NO_CONTENT)
 		self.request('delete', self.new_poll_url, HTTP_204_NO_CONTENT)
 
+	def test_token_cache(self):
+		data = self.request('post', self.auth_url, HTTP_200_OK, self.cred)
+		self.client.credentials(HTTP_AUTHORIZATION='Token ' + data['token'])
+		self.request('post', self.polls_url, HTTP_201_CREATED, self.poll)
+		authentication.tokens.clear()
+		throttling.buckets.clear()
+		before = authentication.counter.snapshot()
+		missed = self.count_queries('get', self.new_poll_url, HTTP_200_OK)
+		self.assertEqual(self.count_queries('get', self.new_poll_url, HTTP_200_OK), missed - 1)
+		after = self.request('get', reverse('stats'), HTTP_200_OK)['token_cache']
+		self.assertEqual(after['misses'] - before['misses'], 1)
+		self.assertEqual(after['hits'] - before['hits'], 2)
+		user = get_user_model().objects.get()
+		user.is_staff = False
+		user.save()
+		self.request('post', self.polls_url, HTTP_403_FORBIDDEN, self.poll)
+		user.auth_token.delete()
+		self.request('post', self.polls_url, HTTP_401_UNAUTHORIZED, self.poll)
+
+	def test_shared_token_cache(self):
+		data = self.request('post', self.auth_url, HTTP_200_OK, self.cred)
+		self.client.credentials(HTTP_AUTHORIZATION='Token ' + data['token'])
+		with self.settings(TOKEN_CACHE_SHARED=True):
+			self.request('post', self.polls_url, HTTP_201_CREATED, self.poll)
+			self.assertFalse(authentication.tokens._users)
+			# Another process changes the user and drops the shared entry.
+			get_user_model().objects.update(is_staff=False)
+			cache.delete(f'token:{data["token"]}')
+			self.request('post', self.polls_url, HTTP_403_FORBIDDEN, self.poll)
+
 
 class PollsTest(BaseTest):
 	"""Tests for Polls."""
@@ -154,6 +221,72 @@ class PollsTest(BaseTest):
 		self.assertEqual(len(data), 0)
 		self.request('get', self.new_poll_url, HTTP_404_NOT_FOUND)
 
+	def test_cursor_pagination(self):
+		for _ in range(5):
+			self.request('post', self.polls_url, HTTP_201_CREATED, self.poll)
+		page = self.request('get', self.polls_url + '?page_size=2', HTTP_200_OK)
+		self.assertIsNone(page['previous'])
+		self.assertEqual([p['id'] for p in page['results']], [1, 2])
+		self.request('delete', self.new_poll_url, HTTP_204_NO_CONTENT)
+		self.request('post', self.polls_url, HTTP_201_CREATED, self.poll)
+		ids = []
+		while page['next']:
+			page = self.request('get', page['next'], HTTP_200_OK)
+			ids.extend(p['id'] for p in page['results'])
+		self.assertEqual(ids, [3, 4, 5, 6])
+
+	def test_fields(self):
+		self.request('post', self.polls_url, HTTP_201_CREATED, self.poll)
+		self.request('post', self.q_list_url, HTTP_201_CREATED, self.question)
+		url = self.polls_url + '?fields=id,title,end_date'
+		data = self.request('get', url, HTTP_200_OK)
+		self.assertEqual(set(data[0]), {'id', 'title', 'end_date'})
+		data = self.request('get', url + '&expand=questions', HTTP_200_OK)
+		self.assertEqual(set(data[0]), {'id', 'title', 'end_date', 'questions'})
+		self.assertEqual(len(data[0]['questions'][0]['choices']), 3)
+		url = self.q_list_url + '?fields=id,text'
+		data = self.request('get', url, HTTP_200_OK)
+		self.assertEqual(data, [{'id': 1, 'text': "Test question"}])
+		data = self.request('get', url + '&expand=choices', HTTP_200_OK)
+		self.assertEqual(set(data[0]), {'id', 'text', 'choices'})
+
+	def test_unknown_expand(self):
+		self.request('post', self.polls_url, HTTP_201_CREATED, self.poll)
+		# Nested serializers are not projected, their fields can't be expanded.
+		for url in (
+			self.polls_url + '?fields=id&expand=choices',
+			self.polls_url + '?expand=questions,choices',
+			self.new_poll_url + '?expand=choices',
+			self.q_list_url + '?fields=id&expand=questions',
+		):
+			for fast in (True, False):
+				with self.settings(FAST_READS=fast):
+					data = self.request('get', url, HTTP_400_BAD_REQUEST)
+				self.assertIn('expand', data, url)
+
+	def test_fast_reads(self):
+		for poll in (self.poll, {**self.poll, 'title': "Second"}):
+			self.request('post', self.polls_url, HTTP_201_CREATED, poll)
+		self.request('post', self.q_list_url, HTTP_201_CREATED, self.question)
+		self.request('post', self.q_list_url, HTTP_201_CREATED, {**self.question, 'q_type': 0})
+		for url in (
+			self.polls_url,
+			self.polls_url + '?fields=id,title',
+			self.polls_url + '?fields=id&expand=questions',
+			self.polls_url + '?page_size=1',
+			self.new_poll_url,
+			self.new_poll_url + '?fields=title',
+			reverse('poll-details', args=(99,)),
+			self.q_list_url,
+			self.q_list_url + '?fields=id,text',
+			self.q_list_url + '?page_size=1',
+		):
+			with self.settings(FAST_READS=False):
+				expected = self.client.get(url)
+			response = self.client.get(url)
+			self.assertEqual(response.status_code, expected.status_code, url)
+			self.assertEqual(response.content, expected.content, url)
+
 
 class QuestionsTest(BaseTest):
 	"""Tests for Questions and Choices."""
@@ -207,6 +340,29 @@ class QuestionsTest(BaseTest):
 			polls = self.request('get', self.polls_url, HTTP_200_OK)
 			self.assertEqual(polls[0]['questions'][0], question)
 
+	def test_sync_choices(self):
+		queries = []
+		for n, url in ((5, self.q_url), (50, reverse('question-details', args=(1, 2)))):
+			question = {**self.question, 'choices': [{'text': str(i)} for i in range(n)]}
+			choices = self.request('post', self.q_list_url, HTTP_201_CREATED, question)['choices']
+			if n == 5:
+				kept, unknown = choices[0]['id'], choices[-1]['id']
+				answer = {'user_id': 1, 'answers': [{'question_id': 1, 'choice': kept}]}
+				self.request('post', self.answer_url, HTTP_201_CREATED, answer)
+			choices[0] = {**choices[0], 'text': "Renamed"}
+			choices[-1] = {'text': "New"}
+			queries.append(self.count_queries('patch', url, HTTP_200_OK, {'choices': choices}))
+		self.assertEqual(queries[0], queries[1])
+		data = self.request('get', self.q_url, HTTP_200_OK)
+		self.assertEqual(data['choices'][0], {'id': kept, 'text': "Renamed"})
+		self.assertEqual([c['text'] for c in data['choices']], ["Renamed", "1", "2", "3", "New"])
+		self.assertEqual(models.Answer.objects.count(), 1)
+
+		data['choices'][1]['id'] = data['choices'][2]['id']
+		self.request('patch', self.q_url, HTTP_400_BAD_REQUEST, data)
+		data['choices'][1]['id'] = unknown
+		self.request('patch', self.q_url, HTTP_400_BAD_REQUEST, data)
+
 	def test_delete(self):
 		self.request('post', self.q_list_url, HTTP_201_CREATED, self.question)
 		data = self.request('get', self.new_poll_url, HTTP_200_OK)
@@ -215,6 +371,34 @@ class QuestionsTest(BaseTest):
 		data = self.request('get', self.new_poll_url, HTTP_200_OK)
 		self.assertEqual(len(data['questions']), 0)
 
+	def test_conditional(self):
+		self.request('post', self.q_list_url, HTTP_201_CREATED, self.question)
+		for url in (self.new_poll_url, self.q_list_url):
+			response = self.client.get(url)
+			etag, last_modified = response['ETag'], response['Last-Modified']
+			with self.assertNumQueries(1):  # Poll version, Token is cached.
+				response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+			self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+			self.assertEqual(response['ETag'], etag)
+			response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+			self.assertEqual(response.status_code, HTTP_304_NOT_MODIFIED)
+			response = self.client.get(f'{url}?fields=id', HTTP_IF_NONE_MATCH=etag)
+			self.assertEqual(response.status_code, HTTP_200_OK)
+
+			self.request('patch', self.q_url, HTTP_200_OK, {'text': url})
+			response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+			self.assertEqual(response.status_code, HTTP_200_OK)
+			self.assertNotEqual(response['ETag'], etag)
+		for method, url, data in (
+			('patch', self.new_poll_url, {'title': "New"}),
+			('delete', self.q_url, None),
+		):
+			etag = self.client.get(self.new_poll_url)['ETag']
+			getattr(self.client, method)(url, data, format='json')
+			response = self.client.get(self.new_poll_url, HTTP_IF_NONE_MATCH=etag)
+			self.assertEqual(response.status_code, HTTP_200_OK)
+		self.request('get', reverse('poll-details', args=('x',)), HTTP_404_NOT_FOUND)
+
 
 class AnswersTest(BaseTest):
 	"""Tests for user's Answers."""
@@ -242,6 +426,14 @@ class AnswersTest(BaseTest):
 		self.assertIn('result', d)
 		self.assertEqual(d['result'], "Answers saved: 4.")
 
+	def test_single_insert(self):
+		with CaptureQueriesContext(connection) as queries:
+			self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		answers_table = f'INSERT INTO "{models.Answer._meta.db_table}"'
+		inserts = [q for q in queries if q['sql'].startswith(answers_table)]
+		self.assertEqual(len(inserts), 1)
+		self.assertEqual(models.Answer.objects.count(), 4)
+
 	def test_duplicate_answer(self):
 		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
 		self.request('post', self.answer_url, HTTP_400_BAD_REQUEST, self.answer)
@@ -266,6 +458,268 @@ class AnswersTest(BaseTest):
 		self.answer['answers'].append({'question_id': 3, 'choice': 999})
 		self.request('post', self.answer_url, HTTP_400_BAD_REQUEST, self.answer)
 
+	def test_repeated_choice(self):
+		self.answer['answers'].append({'question_id': 3, 'choice': 5})
+		self.request('post', self.answer_url, HTTP_400_BAD_REQUEST, self.answer)
+
+	def test_duplicate_rows(self):
+		user_id = self.answer['user_id']
+		models.Answer.objects.create(user_id=user_id, poll_id=1, question_id=3, choice_id=5)
+		answer = serializers.Answer(context={'poll': poll_cache.get(1)})
+		with self.assertRaises(ValidationError):
+			answer.create({'user_id': user_id, 'answers': self.answer['answers']})
+		self.assertEqual(models.Answer.objects.count(), 1)
+
+	def test_other_integrity_error(self):
+		# Like a Choice deleted after validation.
+		answer = serializers.Answer(context={'poll': poll_cache.get(1)})
+		with patch.object(serializers.Answer, '_save', side_effect=IntegrityError):
+			with self.assertRaises(IntegrityError):
+				answer.create({'user_id': 1, 'answers': self.answer['answers']})
+
+	def test_another_question_choice(self):
+		self.answer['answers'][1]['choice'] = 4
+		self.request('post', self.answer_url, HTTP_400_BAD_REQUEST, self.answer)
+
+	def test_validation_queries(self):
+		for question_id in range(4, 10):
+			data = self.request('post', self.q_list_url, HTTP_201_CREATED, self.question)
+			choice = data['choices'][0]['id']
+			self.answer['answers'].append({'question_id': question_id, 'choice': choice})
+		poll = poll_cache.get(1)
+		answer = serializers.Answer(data=self.answer, context={'poll': poll})
+		with self.assertNumQueries(0):
+			self.assertTrue(answer.is_valid(), answer.errors)
+
+	def test_results(self):
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		self.answer['user_id'] = 2
+		self.answer['answers'][3]['choice'] = 6
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		results_url = reverse('poll-results', args=(1,))
+		with self.assertNumQueries(4):
+			data = self.request('get', results_url, HTTP_200_OK)
+		self.assertEqual(data['arbitrary'], 2)
+		self.assertEqual([q['responses'] for q in data['questions']], [2, 2, 2])
+		counts = [[c['count'] for c in q['choices']] for q in data['questions']]
+		self.assertEqual(counts, [[], [2, 0, 0], [2, 1, 1]])
+
+		models.Tally.objects.all().delete()
+		call_command('rebuild_tallies', stdout=StringIO())
+		self.assertEqual(self.request('get', results_url, HTTP_200_OK), data)
+
+		self.client.credentials()
+		self.request('get', reverse('poll-results', args=(2,)), HTTP_404_NOT_FOUND)
+
+	def test_without_upsert(self):
+		with self.settings(DATABASE_UPSERT=False):
+			self.test_results()
+			self.request('post', self.answer_url, HTTP_400_BAD_REQUEST, self.answer)
+
+	def test_queue(self):
+		directory = TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		queue_path = os.path.join(directory.name, 'queue.sqlite3')
+		with self.settings(ANSWER_QUEUE=True, ANSWER_QUEUE_PATH=queue_path):
+			self.client.credentials(HTTP_IDEMPOTENCY_KEY='first')
+			data = self.request('post', self.answer_url, HTTP_202_ACCEPTED, self.answer)
+			self.assertEqual(data, {'key': 'first', 'status': 'queued', 'error': None})
+			repeated = self.request('post', self.answer_url, HTTP_202_ACCEPTED, self.answer)
+			self.assertEqual(repeated, data)
+			self.client.credentials(HTTP_IDEMPOTENCY_KEY='second')
+			self.request('post', self.answer_url, HTTP_202_ACCEPTED, self.answer)
+			self.client.credentials()
+			self.answer['user_id'] = 2
+			self.answer['answers'][3]['choice'] = 6
+			other = self.request('post', self.answer_url, HTTP_202_ACCEPTED, self.answer)
+			self.answer['answers'] = []
+			self.request('post', self.answer_url, HTTP_400_BAD_REQUEST, self.answer)
+			self.assertEqual(models.Answer.objects.count(), 0)
+
+			out = StringIO()
+			call_command('drain_answers', once=True, stdout=out)
+			self.assertIn("Submissions drained: 3.", out.getvalue())
+			self.assertEqual(models.Answer.objects.count(), 8)
+			statuses = [
+				self.request('get', reverse('answer-status', args=(1, key)), HTTP_200_OK)
+				for key in ('first', 'second', other['key'])
+			]
+			self.assertEqual([s['status'] for s in statuses], ['saved', 'rejected', 'saved'])
+			self.assertEqual(statuses[1]['error'], "You've already answered this poll.")
+			self.request('get', reverse('answer-status', args=(2, 'first')), HTTP_404_NOT_FOUND)
+
+			for key in ('a/b', 'k' * 129):
+				self.client.credentials(HTTP_IDEMPOTENCY_KEY=key)
+				data = self.request('post', self.answer_url, HTTP_400_BAD_REQUEST, self.answer)
+				self.assertIn('Idempotency-Key', data)
+			self.client.credentials()
+			self.assertIsNone(ingest.get('a/b'))
+
+		tallies = set(models.Tally.objects.values_list('question', 'choice', 'count'))
+		models.Tally.objects.rebuild(1)
+		rebuilt = set(models.Tally.objects.values_list('question', 'choice', 'count'))
+		self.assertEqual(tallies, rebuilt)
+
+	def test_queue_without_upsert(self):
+		with self.settings(DATABASE_UPSERT=False):
+			self.test_queue()
+
+	def test_drain_error(self):
+		locked = OperationalError('database is locked')
+		command = 'polls_test_service_app.management.commands.drain_answers'
+		with patch.object(ingest, 'drain', side_effect=[locked, 0]) as drain, \
+				patch(f'{command}.close_old_connections'):  # Test's own connection.
+			with self.assertLogs('polls_test_service_app', 'ERROR'):
+				call_command('drain_answers', once=True, interval=0, stdout=StringIO())
+		self.assertEqual(drain.call_count, 2)
+
+	def test_queue_replay(self):
+		directory = TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		for upsert in (True, False):
+			queue_path = os.path.join(directory.name, f'{upsert}.sqlite3')
+			with self.settings(
+				ANSWER_QUEUE=True, ANSWER_QUEUE_PATH=queue_path, DATABASE_UPSERT=upsert
+			):
+				self.answer['user_id'] += 1
+				self.client.credentials(HTTP_IDEMPOTENCY_KEY=f'{upsert}')
+				self.request('post', self.answer_url, HTTP_202_ACCEPTED, self.answer)
+				# Saved, then crashed before marking the item.
+				ingest.save([ingest.get(f'{upsert}')])
+				self.assertEqual(ingest.drain(10), 1)
+				self.assertEqual(ingest.get(f'{upsert}').status, 'saved')
+		self.assertEqual(models.Answer.objects.count(), 8)
+
+	def test_batch(self):
+		batch_url = reverse('answers-batch', args=(1,))
+		self.request('post', self.answer_url, HTTP_201_CREATED, {**self.answer, 'user_id': 3})
+		submissions = [
+			self.answer,
+			{'user_id': 4},
+			self.answer,
+			{**self.answer, 'user_id': 2},
+			{**self.answer, 'user_id': 3},
+		]
+		data = self.request('post', batch_url, HTTP_200_OK, submissions)
+		self.assertEqual((data['saved'], data['rejected']), (2, 3))
+		statuses = [result['status'] for result in data['results']]
+		self.assertEqual(statuses, ['saved', 'rejected', 'rejected', 'saved', 'rejected'])
+		self.assertIn('answers', data['results'][1]['errors'])
+		self.assertEqual(data['results'][2]['errors'], serializers.REPEATED)
+		self.assertEqual(data['results'][4]['errors'], serializers.ANSWERED)
+		self.assertEqual(models.Answer.objects.count(), 12)
+		tallies = set(models.Tally.objects.values_list('question', 'choice', 'count'))
+		models.Tally.objects.rebuild(1)
+		rebuilt = set(models.Tally.objects.values_list('question', 'choice', 'count'))
+		self.assertEqual(tallies, rebuilt)
+
+		queries = [
+			self.count_queries('post', batch_url, HTTP_200_OK, [
+				{**self.answer, 'user_id': user_id} for user_id in range(first, first + n)
+			])
+			for first, n in ((10, 2), (20, 30))
+		]
+		self.assertEqual(queries[0], queries[1])
+		self.assertEqual(models.Submission.objects.count(), 35)
+
+		with self.settings(ANSWER_BATCH_LIMIT=1):
+			self.request('post', batch_url, HTTP_400_BAD_REQUEST, submissions)
+		self.request('post', batch_url, HTTP_400_BAD_REQUEST, [])
+		self.request('post', reverse('answers-batch', args=(2,)), HTTP_404_NOT_FOUND, submissions)
+		self.client.credentials()
+		self.request('post', batch_url, HTTP_401_UNAUTHORIZED, submissions)
+
+	def test_batch_without_upsert(self):
+		with self.settings(DATABASE_UPSERT=False):
+			self.test_batch()
+
+	def test_throttle(self):
+		with self.settings(ANSWER_THROTTLE_USER='2/min', ANSWER_THROTTLE_IP='4/min'):
+			self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+			self.request('post', self.answer_url, HTTP_400_BAD_REQUEST, self.answer)
+			response = self.client.post(self.answer_url, self.answer, format='json')
+			self.assertEqual(response.status_code, HTTP_429_TOO_MANY_REQUESTS)
+			self.assertEqual(response['Retry-After'], '30')
+			self.answer['user_id'] = 2
+			self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+			self.answer['user_id'] = 3
+			self.request('post', self.answer_url, HTTP_429_TOO_MANY_REQUESTS, self.answer)
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+
+	def test_overloaded(self):
+		with self.settings(ANSWER_WRITERS=1, ANSWER_WRITERS_WAIT=0):
+			with throttling.writers.slot():
+				response = self.client.post(self.answer_url, self.answer, format='json')
+			self.assertEqual(response.status_code, HTTP_503_SERVICE_UNAVAILABLE)
+			self.assertEqual(response['Retry-After'], '1')
+			self.assertEqual(throttling.writers.snapshot()['active'], 0)
+			self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		locked = OperationalError('database is locked')
+		with patch.object(serializers.Answer, '_save', side_effect=locked):
+			self.answer['user_id'] = 2
+			self.request('post', self.answer_url, HTTP_503_SERVICE_UNAVAILABLE, self.answer)
+
+	def test_poll_cache(self):
+		before = self.request('get', reverse('stats'), HTTP_200_OK)['poll_cache']
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		self.answer['user_id'] = 2
+		with CaptureQueriesContext(connection) as queries:
+			self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		poll_tables = [
+			f'FROM "{model._meta.db_table}"'
+			for model in (models.Poll, models.Question, models.Choice)
+		]
+		reads = [q for q in queries if any(table in q['sql'] for table in poll_tables)]
+		self.assertEqual(len(reads), 1)  # Poll version.
+		self.request('post', self.q_list_url, HTTP_201_CREATED, self.question)
+		self.answer['user_id'] = 3
+		self.request('post', self.answer_url, HTTP_400_BAD_REQUEST, self.answer)
+		self.answer['answers'].append({'question_id': 4, 'choice': 7})
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		self.request('delete', reverse('question-details', args=(1, 4)), HTTP_204_NO_CONTENT)
+		self.answer['user_id'] = 4
+		self.answer['answers'].pop()
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		# As if changed by another process, which shares only the database.
+		choice = models.Choice.objects.create(question_id=3, text="New")
+		models.Poll.objects.touch(1)
+		self.answer['user_id'] = 5
+		self.answer['answers'][-1]['choice'] = choice.id
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		self.request('delete', self.new_poll_url, HTTP_204_NO_CONTENT)
+		self.request('post', self.answer_url, HTTP_404_NOT_FOUND, self.answer)
+		after = self.request('get', reverse('stats'), HTTP_200_OK)['poll_cache']
+		self.assertEqual(after['hits'] - before['hits'], 2)
+		self.assertEqual(after['misses'] - before['misses'], 4)
+
+	def test_export(self):
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		self.answer['user_id'] = 2
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		export_url = reverse('answers-export', args=(1,))
+		response = self.client.get(export_url)
+		self.assertEqual(response['Content-Type'], 'text/csv')
+		exported = b''.join(response.streaming_content).decode()
+		rows = list(csv.DictReader(StringIO(exported)))
+		self.assertEqual(len(rows), 8)
+		self.assertEqual(rows[1]['choice'], "Choice 1")
+		self.assertEqual(rows[4]['arbitrary'], "arbitrary")
+
+		output = StringIO()
+		call_command('export_answers', 1, batch_size=3, stdout=output)
+		self.assertEqual(output.getvalue(), exported)
+
+		response = self.client.get(export_url + '?type=ndjson')
+		lines = b''.join(response.streaming_content).decode().splitlines()
+		answers = [json.loads(line) for line in lines]
+		self.assertEqual([a['id'] for a in answers], [int(row['id']) for row in rows])
+		self.assertEqual(answers[4]['arbitrary'], "arbitrary")
+		self.assertIsNone(answers[4]['choice'])
+
+		self.request('get', export_url + '?type=xml', HTTP_400_BAD_REQUEST)
+		self.client.credentials()
+		self.request('get', export_url, HTTP_401_UNAUTHORIZED)
+
 	def test_user_answers(self):
 		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
 		data = self.request('get', self.list_answers_url, HTTP_200_OK)
@@ -293,3 +747,464 @@ class AnswersTest(BaseTest):
 			]
 		}
 		self.assertDictEqual(expected, data[0])
+
+	def test_user_answers_stream(self):
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		self.request('post', self.polls_url, HTTP_201_CREATED, self.poll)
+		q_list_url = reverse('questions-list', args=(2,))
+		self.request('post', q_list_url, HTTP_201_CREATED, {**self.question, 'q_type': 0})
+		answer_url = reverse('answer-create', args=(2,))
+		answer = {'user_id': 1, 'answers': [{'question_id': 4, 'choice': "text"}]}
+		self.request('post', answer_url, HTTP_201_CREATED, answer)
+		response = self.client.get(self.list_answers_url + '?stream=1')
+		self.assertEqual(response.status_code, HTTP_200_OK)
+		self.assertTrue(response.streaming)
+		streamed = json.loads(b''.join(response.streaming_content))
+		self.assertEqual(streamed, self.request('get', self.list_answers_url, HTTP_200_OK))
+		self.assertEqual([p['id'] for p in streamed], [1, 2])
+		self.assertEqual(streamed[1]['questions'][0]['choices'], ["text"])
+		for value in ('0', 'false'):
+			response = self.client.get(self.list_answers_url + '?stream=' + value)
+			self.assertFalse(response.streaming)
+			self.assertEqual(response.data, streamed)
+
+	def test_user_answers_order(self):
+		self.request('post', self.polls_url, HTTP_201_CREATED, self.poll)
+		q_list_url = reverse('questions-list', args=(2,))
+		self.request('post', q_list_url, HTTP_201_CREATED, {**self.question, 'q_type': 0})
+		answer = {'user_id': 1, 'answers': [{'question_id': 4, 'choice': "text"}]}
+		self.request('post', reverse('answer-create', args=(2,)), HTTP_201_CREATED, answer)
+		self.answer['answers'].reverse()
+		self.request('post', self.answer_url, HTTP_201_CREATED, self.answer)
+		# Polls and their questions by id, not by when they were answered.
+		data = self.request('get', self.list_answers_url, HTTP_200_OK)
+		self.assertEqual([p['id'] for p in data], [1, 2])
+		self.assertEqual([q['id'] for q in data[0]['questions']], [1, 2, 3])
+
+
+class ImportTest(BaseTest):
+	"""Tests for importing Polls."""
+
+	import_url = reverse('polls-import')
+
+	def setUp(self):
+		self.authorize()
+
+	def tree(self, questions):
+		return {
+			'title': "Imported",
+			'description': "Poll description.",
+			'start_date': timezone.now().isoformat(),
+			'end_date': timezone.now().isoformat(),
+			'questions': [
+				{**self.question, 'q_type': i % 3} if i % 3 else
+				{'text': "Arbitrary", 'q_type': 0}
+				for i in range(questions)
+			],
+		}
+
+	def post(self, text, content_type='application/json'):
+		response = self.client.post(self.import_url, text, content_type=content_type)
+		self.assertEqual(response.status_code, HTTP_200_OK, response.data)
+		return response.data
+
+	def test_import(self):
+		invalid = self.tree(2)
+		del invalid['questions'][1]['choices']
+		no_type = self.tree(1)
+		del no_type['questions'][0]['q_type']
+		data = self.post(json.dumps([self.tree(3), invalid, no_type]))
+		self.assertEqual((data['imported'], data['failed']), (1, 2))
+		self.assertEqual(data['results'][0], {'index': 0, 'id': 1})
+		self.assertIn('choices', data['results'][1]['errors']['questions'][1])
+		self.assertIn('q_type', data['results'][2]['errors']['questions'][0])
+		self.assertEqual(models.Poll.objects.count(), 1)
+
+		poll = self.request('get', self.new_poll_url, HTTP_200_OK)
+		self.assertEqual([q['q_type'] for q in poll['questions']], [0, 1, 2])
+		self.assertEqual([len(q['choices']) for q in poll['questions']], [0, 3, 3])
+		self.assertEqual(
+			[c['text'] for c in poll['questions'][2]['choices']],
+			[c['text'] for c in self.question['choices']]
+		)
+
+	def test_ndjson(self):
+		lines = [json.dumps(self.tree(1)), "{", json.dumps(self.tree(2))]
+		data = self.post('\n'.join(lines), 'application/x-ndjson')
+		self.assertEqual((data['imported'], data['failed']), (2, 1))
+		self.assertIn('non_field_errors', data['results'][1]['errors'])
+		self.assertEqual(models.Question.objects.count(), 3)
+
+	def test_bulk_queries(self):
+		self.request('get', self.polls_url, HTTP_200_OK)  # Caches Token.
+		queries = [
+			self.count_queries('post', self.import_url, HTTP_200_OK, self.tree(n))
+			for n in (3, 60)
+		]
+		self.assertEqual(queries[0], queries[1])
+		self.assertEqual(models.Choice.objects.count(), 2 * 3 + 40 * 3)
+
+	def test_admin_only(self):
+		self.client.credentials()
+		self.request('post', self.import_url, HTTP_401_UNAUTHORIZED, self.tree(1))
+
+	def test_command(self):
+		directory = TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		path = os.path.join(directory.name, 'polls.json')
+		with open(path, 'w') as file:
+			json.dump([self.tree(2), self.tree(1)], file)
+		out = StringIO()
+		call_command('import_polls', path, stdout=out)
+		self.assertIn("Polls imported: 2.", out.getvalue())
+		with open(path, 'w') as file:
+			json.dump({'title': "No dates"}, file)
+		with self.assertRaisesMessage(CommandError, "Polls failed: 1."):
+			call_command('import_polls', path, stdout=out, stderr=StringIO())
+
+
+class QueriesTest(BaseTest):
+	"""Tests for number of queries per request."""
+
+	def setUp(self):
+		self.authorize()
+		self.add_poll()
+		self.add_questions(1)
+
+	def add_poll(self):
+		return self.request('post', self.polls_url, HTTP_201_CREATED, self.poll)['id']
+
+	def add_questions(self, count, poll_id=1):
+		url = reverse('questions-list', args=(poll_id,))
+		for _ in range(count):
+			self.request('post', url, HTTP_201_CREATED, self.question)
+
+	def assertFixedQueries(self, url, grow):
+		before = self.count_queries('get', url, HTTP_200_OK)
+		grow()
+		self.assertEqual(self.count_queries('get', url, HTTP_200_OK), before)
+
+	def test_polls_list(self):
+		def grow():
+			for _ in range(5):
+				self.add_questions(5, self.add_poll())
+		self.assertFixedQueries(self.polls_url, grow)
+
+	def test_poll(self):
+		self.assertFixedQueries(self.new_poll_url, lambda: self.add_questions(5))
+
+	def test_questions_list(self):
+		self.assertFixedQueries(self.q_list_url, lambda: self.add_questions(5))
+
+	def test_question(self):
+		choices = {'choices': [{'text': str(i)} for i in range(10)]}
+		self.assertFixedQueries(
+			self.q_url, lambda: self.request('patch', self.q_url, HTTP_200_OK, choices)
+		)
+
+
+@override_settings(REQUEST_TIMING=True)
+class TimingTest(BaseTest):
+	"""Tests for request timing middleware."""
+
+	def setUp(self):
+		self.logs = self.assertLogs('polls_test_service_app.middleware', 'INFO')
+		self.logged = self.logs.__enter__()
+		self.addCleanup(self.logs.__exit__, None, None, None)
+		self.authorize()
+		self.request('post', self.polls_url, HTTP_201_CREATED, self.poll)
+		self.request('post', self.q_list_url, HTTP_201_CREATED, self.question)
+
+	def test_timing(self):
+		response = self.client.get(self.polls_url)
+		timing = dict(
+			(entry.split(';')[0], entry) for entry in response['Server-Timing'].split(', ')
+		)
+		self.assertEqual(set(timing), {'db', 'auth', 'serialize', 'total'})
+		self.assertIn('desc="3 queries"', timing['db'])
+		logged = json.loads(self.logged.records[-1].getMessage())
+		self.assertEqual(logged['view'], 'polls-list')
+		self.assertEqual(logged['queries'], 3)
+		self.assertGreater(logged['serialize_ms'], 0)
+		self.assertGreater(logged['auth_ms'], 0)
+		self.assertGreaterEqual(logged['total_ms'], logged['db_ms'])
+
+		data = self.request('get', reverse('stats'), HTTP_200_OK)['requests']
+		self.assertGreaterEqual(data['polls-list']['count'], 1)
+		self.assertEqual(
+			set(data['polls-list']),
+			{'count', 'window', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_mean'}
+		)
+
+	def test_disabled(self):
+		with self.settings(REQUEST_TIMING=False):
+			response = APIClient().get(self.polls_url)
+		self.assertNotIn('Server-Timing', response)
+
+
+class DatabaseTest(APITestCase):
+	"""Tests for database configuration and backend-specific queries."""
+
+	def test_pragmas(self):
+		with connection.cursor() as cursor:
+			cursor.execute('PRAGMA cache_size')
+			default = cursor.fetchone()[0]
+			with self.settings(SQLITE_PRAGMAS={'cache_size': -1234}):
+				db.configure_sqlite(sender=None, connection=connection)
+			cursor.execute('PRAGMA cache_size')
+			self.assertEqual(cursor.fetchone()[0], -1234)
+			cursor.execute(f'PRAGMA cache_size = {default}')
+
+	@override_settings(DATABASE_UPSERT=True)
+	def test_upsert(self):
+		# SQLite 3.35+ runs the same ON CONFLICT ... RETURNING as PostgreSQL.
+		self.assertTrue(db.can_upsert())
+		now = timezone.now()
+		poll = models.Poll.objects.create(
+			title='', description='', start_date=now, end_date=now
+		)
+		self.assertTrue(models.Submission.objects.claim(1, poll.id))
+		self.assertFalse(models.Submission.objects.claim(1, poll.id))
+		self.assertTrue(models.Submission.objects.claim(2, poll.id))
+
+	@override_settings(DATABASE_UPSERT=True)
+	def test_tally_order(self):
+		answers = [
+			models.Answer(user_id=user_id, question_id=question_id, choice_id=choice_id)
+			for user_id, question_id, choice_id in (
+				(7, 3, 9), (7, 3, 8), (7, 1, None), (5, 2, 4), (5, 3, 9), (5, 1, 2),
+			)
+		]
+		with patch.object(db, 'upsert') as upsert:
+			models.Tally.objects.add_answers(answers)
+		(_, _, questions, question_conflict, _), (_, _, choices, choice_conflict, _) = [
+			call.args for call in upsert.call_args_list
+		]
+		# Same order in every submission, or concurrent ones can deadlock.
+		self.assertEqual(questions, [(1, None, 2), (2, None, 1), (3, None, 2)])
+		self.assertEqual(choices, [(1, 2, 1), (2, 4, 1), (3, 8, 1), (3, 9, 2)])
+		self.assertEqual(question_conflict, '("question_id") WHERE "choice_id" IS NULL')
+		self.assertEqual(choice_conflict, '("question_id", "choice_id")')
+
+	def test_url(self):
+		self.assertEqual(
+			database_url.parse('postgres://user:p%40ss@db:5433/polls?sslmode=require'),
+			{
+				'ENGINE': 'django.db.backends.postgresql', 'NAME': 'polls',
+				'USER': 'user', 'PASSWORD': 'p@ss', 'HOST': 'db', 'PORT': '5433',
+				'OPTIONS': {'sslmode': 'require'},
+			}
+		)
+		self.assertEqual(
+			database_url.parse('sqlite:////tmp/db.sqlite3'),
+			{'ENGINE': 'django.db.backends.sqlite3', 'NAME': '/tmp/db.sqlite3', 'OPTIONS': {}}
+		)
+		with self.assertRaises(ValueError):
+			database_url.parse('oracle://db/polls')
+
+
+class MigrationTest(APITransactionTestCase):
+	"""Tests for migrating existing data."""
+
+	app = 'polls_test_service_app'
+
+	def migrate(self, name):
+		executor = MigrationExecutor(connection)
+		executor.migrate([(self.app, name)])
+		return executor.loader.project_state((self.app, name)).apps
+
+	def tearDown(self):
+		executor = MigrationExecutor(connection)
+		executor.migrate(executor.loader.graph.leaf_nodes())
+
+	def test_duplicate_answers(self):
+		apps = self.migrate('0001_initial')
+		Poll, Question, Choice, Answer = (
+			apps.get_model(self.app, name)
+			for name in ('Poll', 'Question', 'Choice', 'Answer')
+		)
+		now = timezone.now()
+		poll = Poll.objects.create(title='', description='', start_date=now, end_date=now)
+		question = Question.objects.create(poll=poll, text='', q_type=2)
+		choice = Choice.objects.create(question=question, text='')
+		answer = partial(Answer.objects.create, user_id=1, poll=poll, question=question)
+		kept = [
+			answer(choice=choice).id, answer(arbitrary='a').id,
+			answer(choice=choice, user_id=2).id
+		]
+		answer(choice=choice)
+		answer(arbitrary='b')
+		apps = self.migrate('0002_answer_constraints')
+		answers = apps.get_model(self.app, 'Answer').objects.order_by('id')
+		self.assertEqual(list(answers.values_list('id', flat=True)), kept)
+
+
+@override_settings(DATABASE_LOCKED_RETRIES=2, DATABASE_LOCKED_BACKOFF=0)
+class RetryTest(SimpleTestCase):
+	"""Tests for retrying writes to locked database."""
+
+	def failing(self, *errors):
+		errors = list(errors)
+		calls = []
+
+		@db.retry_on_locked
+		def write():
+			calls.append(1)
+			if errors:
+				raise errors.pop(0)
+			return len(calls)
+		return write
+
+	def test_retry(self):
+		locked = OperationalError("database is locked")
+		self.assertEqual(self.failing(locked, locked)(), 3)
+		with self.assertRaises(OperationalError):
+			self.failing(locked, locked, locked)()
+		with self.assertRaises(OperationalError):
+			self.failing(OperationalError("no such table"))()
+
+
+class BenchmarkTest(APITestCase):
+	"""Tests for benchmark harness."""
+
+	def test_benchmark(self):
+		dataset = benchmark.seed(
+			polls=3, questions=3, choices=2, answers=30, users=5, rand=Random(0)
+		)
+		self.assertEqual(len(dataset.polls), 3)
+		self.assertEqual(models.Submission.objects.count(), 9)
+		tallies = set(models.Tally.objects.values_list('question', 'choice', 'count'))
+		call_command('rebuild_tallies', stdout=StringIO())
+		rebuilt = set(models.Tally.objects.values_list('question', 'choice', 'count'))
+		self.assertEqual(tallies, rebuilt)
+		results = benchmark.run(dataset, requests=4)
+		self.assertEqual(set(results), set(benchmark.SCENARIOS))
+		for result in results.values():
+			self.assertEqual(result['requests'], 4)
+			self.assertEqual(result['errors'], 0)
+			self.assertGreater(result['queries_per_request'], 0)
+			self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+		self.assertEqual(models.Submission.objects.count(), 13)
+		timings = benchmark.serialization(rounds=1)
+		self.assertEqual(timings['polls'], 3)
+		self.assertEqual(set(timings['us_per_poll']), {'serializer', 'fastpath'})
+
+
+class StartTest(APITestCase):
+	"""Test for container entry point."""
+
+	def test_start(self):
+		env = {'DJANGO_SUPERUSER_USERNAME': 'root', 'DJANGO_SUPERUSER_PASSWORD': '!@#$'}
+		with patch.dict(os.environ, env):
+			for _ in range(2):
+				out = StringIO()
+				call_command('start', no_serve=True, stdout=out)
+		self.assertIn("No migrations to apply.", out.getvalue())
+		self.assertIn("Superuser root already exists.", out.getvalue())
+		user = get_user_model().objects.get(username='root')
+		self.assertTrue(user.is_superuser and user.is_staff)
+		self.assertTrue(user.check_password('!@#$'))
+
+
+class ConcurrentAnswersTest(APITransactionTestCase):
+	"""Tests for simultaneous submissions of the same user."""
+
+	def setUp(self):
+		cache.clear()
+		poll = models.Poll.objects.create(**BaseTest.poll)
+		question = models.Question.objects.create(poll=poll, q_type=1)
+		choice = models.Choice.objects.create(question=question)
+		self.url = reverse('answer-create', args=(poll.id,))
+		self.answer = {
+			'user_id': 1, 'answers': [{'question_id': question.id, 'choice': choice.id}]
+		}
+
+	def submit(self, _):
+		try:
+			return APIClient().post(self.url, self.answer, format='json').status_code
+		finally:
+			connection.close()
+
+	def test_parallel_submissions(self):
+		with ThreadPoolExecutor(max_workers=8) as pool:
+			statuses = list(pool.map(self.submit, range(32)))
+		self.assertEqual(statuses.count(HTTP_201_CREATED), 1, statuses)
+		self.assertEqual(statuses.count(HTTP_400_BAD_REQUEST), 31, statuses)
+		self.assertEqual(models.Submission.objects.count(), 1)
+		self.assertEqual(models.Answer.objects.count(), 1)
+
+
+class AsgiTest(APITransactionTestCase):
+	"""Tests for serving through ASGI."""
+
+	def setUp(self):
+		cache.clear()
+		now = timezone.now()
+		self.poll = poll = models.Poll.objects.create(
+			title="Poll", description="", start_date=now, end_date=now
+		)
+		question = models.Question.objects.create(poll=poll, text="Question", q_type=1)
+		choice = models.Choice.objects.create(question=question, text="Choice")
+		models.Answer.objects.create(
+			user_id=1, poll=poll, question=question, choice=choice
+		)
+
+	@classmethod
+	def call(cls, method, url, query=b''):
+		return asyncio.run(cls.serve(method, url, query))
+
+	@staticmethod
+	async def serve(method, url, query=b''):
+		messages = []
+
+		async def receive():
+			return {'type': 'http.request'}
+
+		async def send(message):
+			messages.append(message)
+
+		scope = {
+			'type': 'http', 'method': method, 'path': url, 'query_string': query,
+			'http_version': '1.1', 'headers': [],
+		}
+		await asgi.application(scope, receive, send)
+		body = b''.join(message.get('body', b'') for message in messages[1:])
+		return messages[0]['status'], body
+
+	def test_reads(self):
+		for url, query in (
+			(reverse('polls-list'), b''),
+			(reverse('polls-list'), b'page_size=1&expand=questions'),
+			(reverse('answers-list', args=(1,)), b''),
+			(reverse('answers-list', args=(1,)), b'stream=1'),
+		):
+			status, body = self.call('GET', url, query)
+			self.assertEqual(status, HTTP_200_OK)
+			response = self.client.get(f'{url}?{query.decode()}')
+			self.assertEqual(json.loads(body), json.loads(response.getvalue()))
+		self.assertEqual(self.call('HEAD', reverse('polls-list')), (HTTP_200_OK, b''))
+
+	def test_routing(self):
+		scope = {'type': 'http', 'method': 'GET', 'query_string': b''}
+		is_async = asgi.application.is_async_read
+		self.assertTrue(is_async({**scope, 'path': reverse('polls-list')}))
+		self.assertFalse(is_async({**scope, 'path': reverse('poll-details', args=(1,))}))
+		self.assertFalse(is_async({**scope, 'path': '/missing/'}))
+		self.assertFalse(is_async({**scope, 'path': reverse('polls-list'), 'method': 'POST'}))
+		status, _body = self.call('POST', reverse('answer-create', args=(self.poll.id,)))
+		self.assertEqual(status, HTTP_400_BAD_REQUEST)
+
+	def test_concurrency(self):
+		barrier = Barrier(2, timeout=5)
+
+		def get(view, request, *args, **kwargs):
+			barrier.wait()  # Fails unless both requests run at once.
+			return HttpResponse(str(get_ident()))
+
+		async def both(url):
+			return await asyncio.gather(self.serve('GET', url), self.serve('GET', url))
+
+		with patch.object(views.Results, 'get', get):
+			responses = asyncio.run(both(reverse('poll-results', args=(self.poll.id,))))
+		self.assertEqual([status for status, _ in responses], [HTTP_200_OK] * 2)
+		self.assertNotEqual(*[thread for _, thread in responses])
@@ -0,0 +1,201 @@
+"""Rate limits and load shedding of anonymous Answers."""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from math import ceil
+from threading import BoundedSemaphore, Lock
+from time import monotonic, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError
+from rest_framework.exceptions import APIException
+from rest_framework.status import HTTP_503_SERVICE_UNAVAILABLE
+from rest_framework.throttling import SimpleRateThrottle
+
+from polls_test_service_app import stats
+from polls_test_service_app.db import is_locked
+
+
+class Buckets:
+	"""Token buckets by key, holding up to `capacity` tokens refilled at
+	`rate` per second.
+
+	Kept in process for at most `THROTTLE_BUCKETS` least recently used keys,
+	with `THROTTLE_SHARED` in the shared cache instead. Shared buckets are
+	read and written without locking, so concurrent workers may let a few
+	extra requests through.
+	"""
+
+	def __init__(self):
+		self._lock = Lock()
+		self._buckets = OrderedDict()
+		self.allowed = 0
+		self.throttled = 0
+
+	def take(self, key, capacity, rate):
+		"""Take a token from `key` bucket, return 0 or seconds until there
+		is one."""
+		if settings.THROTTLE_SHARED:
+			wait = self._take_shared(key, capacity, rate)
+		else:
+			wait = self._take_local(key, capacity, rate)
+		with self._lock:
+			if wait:
+				self.throttled += 1
+			else:
+				self.allowed += 1
+		return wait
+
+	@staticmethod
+	def _refill(bucket, capacity, rate, now):
+		tokens, updated = bucket or (capacity, now)
+		return min(capacity, tokens + (now - updated) * rate)
+
+	def _take_local(self, key, capacity, rate):
+		now = monotonic()
+		with self._lock:
+			tokens = self._refill(self._buckets.pop(key, None), capacity, rate, now)
+			if tokens >= 1:
+				tokens, wait = tokens - 1, 0
+			else:
+				wait = (1 - tokens) / rate
+			self._buckets[key] = tokens, now
+			while len(self._buckets) > settings.THROTTLE_BUCKETS:
+				self._buckets.popitem(last=False)
+		return wait
+
+	def _take_shared(self, key, capacity, rate):
+		key, now = f'throttle:{key}', time()
+		tokens = self._refill(cache.get(key), capacity, rate, now)
+		if tokens < 1:
+			return (1 - tokens) / rate
+		cache.set(key, (tokens - 1, now), ceil(capacity / rate))
+		return 0
+
+	def clear(self):
+		with self._lock:
+			self._buckets.clear()
+
+	def snapshot(self):
+		with self._lock:
+			return {'allowed': self.allowed, 'throttled': self.throttled}
+
+
+buckets = stats.register('throttle', Buckets())
+
+
+class BucketThrottle(SimpleRateThrottle):
+	"""Token bucket throttle with `rate_setting` rate like `20/min`, allowing
+	bursts of its number of requests. Off while the setting is empty."""
+
+	rate_setting = None
+
+	def get_rate(self):
+		return getattr(settings, self.rate_setting) or None
+
+	def allow_request(self, request, view):
+		if self.rate is None or (key := self.get_cache_key(request, view)) is None:
+			return True
+		self.wait_time = buckets.take(
+			f'{self.scope}:{key}', self.num_requests, self.num_requests / self.duration
+		)
+		return not self.wait_time
+
+	def wait(self):
+		return self.wait_time
+
+
+class AnswerIPThrottle(BucketThrottle):
+	"""Answers from one client address."""
+
+	scope = 'answer_ip'
+	rate_setting = 'ANSWER_THROTTLE_IP'
+
+	def get_cache_key(self, request, view):
+		return self.get_ident(request)
+
+
+class AnswerUserThrottle(BucketThrottle):
+	"""Answers for one `user_id`."""
+
+	scope = 'answer_user'
+	rate_setting = 'ANSWER_THROTTLE_USER'
+
+	def get_cache_key(self, request, view):
+		if not isinstance(request.data, dict):
+			return None
+		return request.data.get('user_id')
+
+
+class Overloaded(APIException):
+	status_code = HTTP_503_SERVICE_UNAVAILABLE
+	default_detail = "Too many answers are being saved, try again later."
+	default_code = 'overloaded'
+
+	def __init__(self, wait):
+		super().__init__()
+		self.wait = ceil(wait)
+
+
+class Writers:
+	"""Limit of Answers saved at once by this process.
+
+	Requests wait `ANSWER_WRITERS_WAIT` seconds for a free slot, then are
+	refused with `Overloaded` instead of queueing up on the database lock.
+	"""
+
+	def __init__(self):
+		self._lock = Lock()
+		self._slots = None
+		self.active = 0
+		self.shed = 0
+
+	def _semaphore(self):
+		with self._lock:
+			if self._slots is None or self._slots[0] != settings.ANSWER_WRITERS:
+				self._slots = settings.ANSWER_WRITERS, BoundedSemaphore(settings.ANSWER_WRITERS)
+			return self._slots[1]
+
+	@contextmanager
+	def slot(self):
+		if not settings.ANSWER_WRITERS:
+			yield
+			return
+		semaphore = self._semaphore()
+		if not semaphore.acquire(timeout=settings.ANSWER_WRITERS_WAIT):
+			with self._lock:
+				self.shed += 1
+			raise Overloaded(settings.ANSWER_RETRY_AFTER)
+		with self._lock:
+			self.active += 1
+		try:
+			yield
+		finally:
+			with self._lock:
+				self.active -= 1
+			semaphore.release()
+
+	def snapshot(self):
+		with self._lock:
+			return {
+				'limit': settings.ANSWER_WRITERS or None,
+				'active': self.active,
+				'shed': self.shed,
+			}
+
+
+writers = stats.register('answer_writers', Writers())
+
+
+@contextmanager
+def shed_load():
+	"""Save Answers in a `writers` slot, responding `Overloaded` if there is
+	none or the database stays locked."""
+	try:
+		with writers.slot():
+			yield
+	except OperationalError as e:
+		if not is_locked(e):
+			raise
+		raise Overloaded(settings.ANSWER_RETRY_AFTER) from e
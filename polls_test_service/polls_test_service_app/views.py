@@ -1,41 +1,168 @@
 """Views."""
 
+import re
+from hashlib import md5
+from itertools import groupby
+from operator import itemgetter
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework.generics import (
 	CreateAPIView, GenericAPIView, ListCreateAPIView,
 	RetrieveUpdateDestroyAPIView, get_object_or_404
 )
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.serializers import ValidationError
+from rest_framework.status import HTTP_202_ACCEPTED
+from rest_framework.views import APIView
+
+from polls_test_service_app import (
+	export, fastpath, imports, ingest, metrics, models, poll_cache, serializers,
+	stats, throttling
+)
+from polls_test_service_app.models import QuestionType as QType
+from polls_test_service_app.pagination import IdCursorPagination
+
 
-from polls_test_service_app import models, serializers
+def visible_polls(user):
+	"""All Polls for admin, finished ones for others."""
+	if user.is_staff:
+		return models.Poll.objects.all()
+	return models.Poll.objects.filter(end_date__lt=timezone.now())
 
 
-class PollsList(ListCreateAPIView):
+class FastList:
+	"""Lists with `fastpath` from `get_rows` instead of serializer when
+	`FAST_READS` is on."""
+
+	def list(self, request, *args, **kwargs):
+		if not settings.FAST_READS:
+			return super().list(request, *args, **kwargs)
+		rows = self.get_rows()
+		page = self.paginate_queryset(rows)
+		with metrics.phase('serialize'):
+			data = self.fast_serialize(
+				rows if page is None else page,
+				serializers.requested_fields(request, self.serializer_class.expandable)
+			)
+		if page is None:
+			return Response(data)
+		return self.get_paginated_response(data)
+
+
+class PollsList(FastList, ListCreateAPIView):
 	"""GET, POST Polls."""
 
 	serializer_class = serializers.Poll
+	pagination_class = IdCursorPagination
+	fast_serialize = staticmethod(fastpath.polls)
 
 	def get_queryset(self):
-		if self.request.user.is_staff:
-			return models.Poll.objects.all()
-		return models.Poll.objects.filter(end_date__lt=timezone.now())
+		polls = visible_polls(self.request.user)
+		if serializers.includes_field(self.request, 'questions'):
+			polls = polls.prefetch_related('questions__choices')
+		return polls
+
+	def get_rows(self):
+		return visible_polls(self.request.user).values(*fastpath.POLL_COLUMNS)
+
+
+class PollsImport(APIView):
+	"""POST Polls with Questions and Choices as JSON or NDJSON."""
+
+	permission_classes = (IsAdminUser,)
+
+	def post(self, request, *args, **kwargs):
+		try:
+			text = request.body.decode()
+		except UnicodeDecodeError as e:
+			raise ValidationError("Request body must be UTF-8.") from e
+		results = imports.import_polls(imports.parse(text))
+		imported = sum('id' in result for result in results)
+		return Response({
+			'imported': imported, 'failed': len(results) - imported, 'results': results
+		})
+
+
+class Conditional:
+	"""Answers GET with 304 while the Poll in `poll_kwarg` is not changed.
+
+	ETag also depends on query string and response format.
+	"""
+
+	poll_kwarg = 'poll_id'
 
+	def get(self, request, *args, **kwargs):
+		try:
+			state = (
+				models.Poll.objects.filter(id=self.kwargs[self.poll_kwarg])
+				.values_list('version', 'modified').first()
+			)
+		except ValueError:  # Not a number, left for the view to answer 404.
+			state = None
+		if state is None:
+			return super().get(request, *args, **kwargs)
+		version, modified = state
+		variant = md5(
+			f'{request.accepted_renderer.format}?{request.META.get("QUERY_STRING", "")}'
+			.encode()
+		).hexdigest()[:12]
+		etag = quote_etag(f'{version}.{modified.timestamp()}.{variant}')
+		last_modified = int(modified.timestamp())
+		response = get_conditional_response(request, etag, last_modified)
+		if response is None:
+			response = super().get(request, *args, **kwargs)
+		response['ETag'] = etag
+		response['Last-Modified'] = http_date(last_modified)
+		return response
 
-class Poll(RetrieveUpdateDestroyAPIView):
+
+class Poll(Conditional, RetrieveUpdateDestroyAPIView):
 	"""GET, PUT, PATCH, DELETE Poll."""
 
-	queryset = models.Poll.objects.all()
+	poll_kwarg = 'pk'
+	queryset = models.Poll.objects.prefetch_related('questions__choices')
 	serializer_class = serializers.Poll
 
+	def retrieve(self, request, *args, **kwargs):
+		if not settings.FAST_READS:
+			return super().retrieve(request, *args, **kwargs)
+		row = get_object_or_404(
+			models.Poll.objects.values(*fastpath.POLL_COLUMNS), id=self.kwargs['pk']
+		)
+		with metrics.phase('serialize'):
+			poll, = fastpath.polls(
+				[row], serializers.requested_fields(request, serializers.Poll.expandable)
+			)
+		return Response(poll)
+
 
-class QuestionsList(ListCreateAPIView):
+class QuestionsList(Conditional, FastList, ListCreateAPIView):
 	"""GET, POST Questions."""
 
 	serializer_class = serializers.Question
+	pagination_class = IdCursorPagination
+	fast_serialize = staticmethod(fastpath.questions)
 
 	def get_queryset(self):
-		return models.Question.objects.filter(poll_id=self.kwargs['poll_id'])
+		questions = models.Question.objects.filter(poll_id=self.kwargs['poll_id'])
+		if serializers.includes_field(self.request, 'choices'):
+			questions = questions.prefetch_related('choices')
+		return questions
+
+	def get_rows(self):
+		return (
+			models.Question.objects.filter(poll_id=self.kwargs['poll_id'])
+			.values(*fastpath.QUESTION_COLUMNS)
+		)
 
 	def get_serializer_context(self):
 		context = super().get_serializer_context()
@@ -48,8 +175,20 @@ class Question(RetrieveUpdateDestroyAPIView):
 
 	serializer_class = serializers.Question
 
+	def perform_destroy(self, instance):
+		with transaction.atomic():
+			super().perform_destroy(instance)
+			models.Poll.objects.touch(instance.poll_id)
+
 	def get_queryset(self):
-		return models.Question.objects.filter(poll_id=self.kwargs['poll_id'])
+		return (
+			models.Question.objects
+			.prefetch_related('choices').filter(poll_id=self.kwargs['poll_id'])
+		)
+
+
+# Fits `str` converter of answer-status path, which its Location points to.
+IDEMPOTENCY_KEY = re.compile(r'[^/]{1,128}')
 
 
 class Answer(CreateAPIView):
@@ -58,38 +197,190 @@ class Answer(CreateAPIView):
 	queryset = models.Answer.objects.all()
 	serializer_class = serializers.Answer
 	permission_classes = (AllowAny,)
+	throttle_classes = (throttling.AnswerIPThrottle, throttling.AnswerUserThrottle)
 
 	def get_serializer_context(self):
 		context = super().get_serializer_context()
-		context['poll'] = get_object_or_404(models.Poll, id=self.kwargs['poll_id'])
+		if (poll := poll_cache.get(self.kwargs['poll_id'])) is None:
+			raise Http404
+		context['poll'] = poll
 		return context
 
+	def create(self, request, *args, **kwargs):
+		"""Save Answers, or with `ANSWER_QUEUE` enqueue them and respond 202.
+
+		Queued submission is found by `Idempotency-Key` header if given,
+		repeating a request with it returns the stored submission.
+		Responds 503 if the database stays locked or `ANSWER_WRITERS` are busy.
+		"""
+		with throttling.shed_load():
+			return self._create(request, *args, **kwargs)
+
+	def _create(self, request, *args, **kwargs):
+		if not settings.ANSWER_QUEUE:
+			return super().create(request, *args, **kwargs)
+		poll_id = self.kwargs['poll_id']
+		key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+		if key and not IDEMPOTENCY_KEY.fullmatch(key):
+			raise ValidationError(
+				{'Idempotency-Key': "At most 128 characters other than '/'."}
+			)
+		if not key or (item := ingest.get(key)) is None:
+			serializer = self.get_serializer(data=request.data)
+			serializer.is_valid(raise_exception=True)
+			data = serializer.validated_data
+			item = ingest.enqueue(
+				key or uuid4().hex, poll_id, data['user_id'], data['answers']
+			)
+		if item.poll_id != poll_id:
+			raise ValidationError({'Idempotency-Key': "Used for another poll."})
+		location = reverse('answer-status', args=(poll_id, item.key))
+		return Response(
+			queued(item), status=HTTP_202_ACCEPTED, headers={'Location': location}
+		)
+
+
+class AnswersBatch(APIView):
+	"""POST many users' Answers to Poll at once."""
+
+	def post(self, request, *args, **kwargs):
+		if (poll := poll_cache.get(self.kwargs['poll_id'])) is None:
+			raise Http404
+		submissions = request.data
+		if not isinstance(submissions, list) or not submissions:
+			raise ValidationError("Expected a non-empty list of submissions.")
+		if len(submissions) > settings.ANSWER_BATCH_LIMIT:
+			raise ValidationError(
+				f"At most {settings.ANSWER_BATCH_LIMIT} submissions are allowed."
+			)
+		with throttling.shed_load():
+			results = serializers.save_answer_batch(poll, submissions)
+		saved = sum(result['status'] == 'saved' for result in results)
+		return Response({
+			'saved': saved, 'rejected': len(results) - saved, 'results': results
+		})
+
+
+def queued(item):
+	return {'key': item.key, 'status': item.status, 'error': item.error}
+
+
+class AnswerStatus(APIView):
+	"""GET status of queued Answers."""
+
+	permission_classes = (AllowAny,)
+
+	def get(self, request, *args, **kwargs):
+		if not settings.ANSWER_QUEUE:
+			raise Http404
+		item = ingest.get(self.kwargs['key'])
+		if item is None or item.poll_id != self.kwargs['poll_id']:
+			raise Http404
+		return Response(queued(item))
+
+
+class AnswersExport(APIView):
+	"""GET all Answers to Poll as CSV or NDJSON (`?type=`)."""
+
+	permission_classes = (IsAdminUser,)
+
+	def get(self, request, *args, **kwargs):
+		poll = get_object_or_404(models.Poll, id=self.kwargs['poll_id'])
+		kind = request.query_params.get('type', 'csv')
+		if kind not in export.FORMATS:
+			raise ValidationError({'type': f"Must be one of {list(export.FORMATS)}."})
+		render, content_type = export.FORMATS[kind]
+		response = StreamingHttpResponse(
+			render(export.answer_batches(poll.id)), content_type=content_type
+		)
+		response['Content-Disposition'] = (
+			f'attachment; filename="poll_{poll.id}_answers.{kind}"'
+		)
+		return response
+
+
+class Results(GenericAPIView):
+	"""GET Poll results."""
+
+	def get_queryset(self):
+		return visible_polls(self.request.user).prefetch_related('questions__choices')
+
+	def get(self, *args, **kwargs):
+		poll = get_object_or_404(self.get_queryset(), id=self.kwargs['poll_id'])
+		counts = {
+			(question, choice): count
+			for question, choice, count in models.Tally.objects
+			.filter(question__poll=poll).values_list('question_id', 'choice_id', 'count')
+		}
+		questions = [{
+			'id': q.id,
+			'text': q.text,
+			'q_type': q.q_type,
+			'responses': counts.get((q.id, None), 0),
+			'choices': [{
+				'id': c.id,
+				'text': c.text,
+				'count': counts.get((q.id, c.id), 0)
+			} for c in q.choices.all()]
+		} for q in poll.questions.all()]
+		return Response({
+			'id': poll.id,
+			'title': poll.title,
+			'arbitrary': sum(
+				q['responses'] for q in questions
+				if QType(q['q_type']) is QType.ARBITRARY
+			),
+			'questions': questions
+		})
+
 
 class UserAnswers(GenericAPIView):
-	"""GET user's Answers."""
+	"""GET user's Answers by Poll and Question id, streamed with `?stream=1`."""
 
 	def get_queryset(self):
 		return (
 			models.Answer.objects
-			.select_related('poll').select_related('question').select_related('choice')
 			.filter(user_id=self.kwargs['user_id'])
+			.order_by('poll_id', 'question_id', 'id')
+			.values_list(
+				'poll_id', 'poll__title', 'poll__description',
+				'question_id', 'question__text', 'arbitrary', 'choice__text'
+			)
 		)
 
-	def get(self, *args, **kwargs):
-		grouped = {}
-		for answer in self.get_queryset():
-			grouped.setdefault(answer.poll, {}).setdefault(answer.question, [])\
-				.append(answer.arbitrary or answer.choice.text)
-		user_answers = []
-		for poll, question in grouped.items():
-			user_answers.append({
-				'id': poll.id,
-				'title': poll.title,
-				'description': poll.description,
+	@staticmethod
+	def group(rows):
+		"""Polls with their questions and choices from ordered answer rows."""
+		for (poll_id, title, description), poll_rows in groupby(rows, itemgetter(0, 1, 2)):
+			yield {
+				'id': poll_id,
+				'title': title,
+				'description': description,
 				'questions': [{
-					'id': q.id,
-					'text': q.text,
-					'choices': [c for c in choices]
-				} for q, choices in question.items()]
-			})
-		return Response(user_answers)
+					'id': question_id,
+					'text': text,
+					'choices': [arbitrary or choice for *_, arbitrary, choice in choices]
+				} for (question_id, text), choices in groupby(poll_rows, itemgetter(3, 4))]
+			}
+
+	def stream(self):
+		render = JSONRenderer().render
+		yield b'['
+		polls = self.group(self.get_queryset().iterator(chunk_size=1000))
+		for i, poll in enumerate(polls):
+			yield b',' + render(poll) if i else render(poll)
+		yield b']'
+
+	def get(self, request, *args, **kwargs):
+		if request.query_params.get('stream') == '1':
+			return StreamingHttpResponse(self.stream(), content_type='application/json')
+		return Response(list(self.group(self.get_queryset())))
+
+
+class Stats(APIView):
+	"""GET in-process counters."""
+
+	permission_classes = (IsAdminUser,)
+
+	def get(self, *args, **kwargs):
+		return Response(stats.snapshot())